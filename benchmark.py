@@ -0,0 +1,298 @@
+""" Headless benchmarks for the editor's hot paths.
+
+Run with `python benchmark.py`, results are written as JSON so runs can be compared:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json  # exits with 1 when something got slower
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Qt needs a platform before QApplication exists, offscreen works without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QEvent, QObject, QSettings, QStandardPaths, QT_VERSION_STR, PYQT_VERSION_STR
+
+import editorarea
+import highlighter
+
+# Generated corpora: name -> (shape, line count)
+CORPORA = {
+    "code-1k": ("code", 1000),
+    "code-10k": ("code", 10000),
+    "code-50k": ("code", 50000),
+    "long-lines": ("long_lines", 200),
+    "strings": ("strings", 10000),
+    "comments": ("comments", 10000),
+}
+QUICK_CORPORA = ["code-1k", "long-lines", "strings", "comments"]
+
+
+def generate_corpus(shape, lines, seed=0):
+    """ Builds a Python source text of the given shape with roughly the given number of lines """
+    rng = random.Random(seed)
+    names = ["value", "total", "index", "result", "item", "config", "buffer", "node", "path", "count"]
+    out = []
+
+    while len(out) < lines:
+        name = rng.choice(names)
+        if shape == "long_lines":
+            # Minified style: one huge expression per line
+            terms = " + ".join(f"{rng.choice(names)}_{i} * {rng.randint(0, 999)}" for i in range(400))
+            out.append(f"{name} = {terms}")
+        elif shape == "strings":
+            out.append(f'{name} = "some {name} text" + \'{rng.randint(0, 99)}\' + f"{{{name}}}"')
+            out.append(f'    """multi-line docstring about {name}')
+            out.append(f"    that keeps going = {rng.random()}")
+            out.append('    """')
+        elif shape == "comments":
+            out.append(f"# {name}: explains why {rng.choice(names)} is updated here and not later")
+            out.append(f"{name} = {rng.randint(0, 9999)}  # trailing comment with (parens) and 'quotes'")
+        else:
+            out.append(f"class {name.title()}{len(out)}(object):")
+            out.append(f'    """Docstring for {name}."""')
+            out.append(f"    def {name}_method(self, {rng.choice(names)}, flag=True):")
+            out.append(f"        {name} = len(self.{rng.choice(names)}) + {rng.randint(0, 9999)} * 0x1F")
+            out.append(f"        if {name} >= {rng.random():.4f} and isinstance({name}, int):")
+            out.append(f"            return print('{name}', {name})")
+            out.append("")
+    return "\n".join(out[:lines]) + "\n"
+
+
+def summarize(samples):
+    """ Reduces a list of timings (seconds) to the numbers stored in the results file """
+    samples = sorted(samples)
+    return {
+        "median": statistics.median(samples),
+        "min": samples[0],
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "samples": len(samples),
+    }
+
+
+class PaintWatcher(QObject):
+    """ Notes when a widget receives its first paint event """
+
+    def __init__(self):
+        super().__init__()
+        self.painted = False
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            self.painted = True
+        return False
+
+
+def bench_highlight_block(app, text):
+    """ Times every highlightBlock call of a full highlight pass """
+    timings = []
+
+    class TimedHighlighter(highlighter.PythonHighlighter):
+        def highlightBlock(self, block_text):
+            start = time.perf_counter()
+            super().highlightBlock(block_text)
+            timings.append(time.perf_counter() - start)
+
+    editor = editorarea.CodeEditor()
+    editor.setPlainText(text)
+    timed = TimedHighlighter(editor.document())
+    timed.rehighlight()
+    timed.setDocument(None)
+    return summarize(timings)
+
+
+def bench_rehighlight(app, text, repeat):
+    """ Times rehighlighting the whole document """
+    editor = editorarea.CodeEditor()
+    editor.setPlainText(text)
+    python_highlighter = highlighter.PythonHighlighter(editor.document())
+    app.processEvents()  # Let the highlighter's own delayed pass run first
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        python_highlighter.rehighlight()
+        timings.append(time.perf_counter() - start)
+    python_highlighter.setDocument(None)
+    return summarize(timings)
+
+
+def bench_open_file(app, path, repeat):
+    """ Times opening a file (open_file without the tree view lookup) until the editor has painted it """
+    import qwerty
+
+    timings = []
+    for _ in range(repeat):
+        window = qwerty.TextEditorApp()
+        window.show()
+        app.processEvents()
+
+        watcher = PaintWatcher()
+        window.text_edit.viewport().installEventFilter(watcher)
+        start = time.perf_counter()
+        window.open_path(path)
+        while not watcher.painted:
+            app.processEvents()
+        timings.append(time.perf_counter() - start)
+
+        window.text_edit.viewport().removeEventFilter(watcher)
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+    return summarize(timings)
+
+
+def bench_line_numbers(app, text):
+    """ Times line_number_paint_event while scrolling through the document a page at a time """
+    editor = editorarea.CodeEditor()
+    editor.resize(800, 1200)
+    editor.setPlainText(text)
+    editor.show()
+    app.processEvents()
+
+    timings = []
+    paint_event = editor.line_number_paint_event
+
+    def timed_paint_event(event):
+        start = time.perf_counter()
+        paint_event(event)
+        timings.append(time.perf_counter() - start)
+
+    editor.line_number_paint_event = timed_paint_event
+
+    scroll_bar = editor.verticalScrollBar()
+    for value in range(0, scroll_bar.maximum() + 1, max(1, scroll_bar.pageStep())):
+        scroll_bar.setValue(value)
+        editor.line_number_area.repaint()
+
+    editor.close()
+    return summarize(timings)
+
+
+def bench_save_file(app, text, repeat):
+    """ Times save_file until the document is written back to disk """
+    import qwerty
+
+    window = qwerty.TextEditorApp()
+
+    timings = []
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "saved.py")
+        with open(path, "w") as file:
+            file.write(text)
+        window.open_path(path)
+        while window.file_reader is not None:
+            app.processEvents()
+
+        for _ in range(repeat):
+            window.text_edit.document().setModified(True)  # Unmodified documents aren't written at all
+            start = time.perf_counter()
+            window.save_file()
+            while window.document_saver.is_saving():
+                app.processEvents()
+            timings.append(time.perf_counter() - start)
+
+    window.document_saver.close()
+    window.deleteLater()
+    return summarize(timings)
+
+
+def isolate_user_state(folder):
+    """ Points the editor's settings and cache away from the user's, so the windows benchmarked don't index a
+    saved workspace, offer back leftover journals in a dialog nobody can answer, or write into the real cache """
+    QStandardPaths.setTestModeEnabled(True)
+    shutil.rmtree(os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), "qwerty"), ignore_errors=True)
+    # Only file-based settings can be moved, the registry on Windows and preferences on macOS stay where they are
+    for settings_format in (QSettings.NativeFormat, QSettings.IniFormat):
+        QSettings.setPath(settings_format, QSettings.UserScope, folder)
+
+
+def run(corpora, repeat):
+    """ Runs every benchmark over every corpus and returns the results keyed by benchmark/corpus """
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as folder:
+        isolate_user_state(os.path.join(folder, "settings"))
+        for name in corpora:
+            shape, lines = CORPORA[name]
+            text = generate_corpus(shape, lines)
+            path = os.path.join(folder, f"{name}.py")
+            with open(path, "w") as file:
+                file.write(text)
+
+            print(f"{name}: {lines} lines, {len(text) // 1024} KiB", file=sys.stderr)
+            results[f"highlight_block/{name}"] = bench_highlight_block(app, text)
+            results[f"rehighlight/{name}"] = bench_rehighlight(app, text, repeat)
+            results[f"open_file/{name}"] = bench_open_file(app, path, repeat)
+            results[f"line_numbers/{name}"] = bench_line_numbers(app, text)
+            results[f"save_file/{name}"] = bench_save_file(app, text, repeat)
+
+    return results
+
+
+def compare(results, baseline, threshold):
+    """ Returns the benchmarks whose median got slower than the baseline by more than threshold """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]["median"]
+        after = result["median"]
+        if before > 0 and after > before * (1 + threshold):
+            regressions.append((name, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Qwerty's highlighting, file open, gutter and save paths.")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging (default 0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per timed operation")
+    parser.add_argument("--quick", action="store_true", help="only run the small corpora")
+    args = parser.parse_args()
+
+    corpora = QUICK_CORPORA if args.quick else list(CORPORA)
+    results = run(corpora, args.repeat)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)["results"]
+
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
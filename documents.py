@@ -0,0 +1,141 @@
+from PyQt5.QtWidgets import QPlainTextDocumentLayout
+from PyQt5.QtGui import QTextDocument, QTextCursor
+from collections import OrderedDict
+import zlib
+import os
+
+import longlines
+
+# Rough cost of a document in memory: UTF-16 text plus the block, layout and highlight formats of each line
+CHAR_BYTES = 2
+BLOCK_BYTES = 600
+
+
+def new_document(text=""):
+    """ Creates a document that can be shown in a QPlainTextEdit, in long-line mode if text has a line too long to lay out """
+    document = QTextDocument()
+    document.setDocumentLayout(QPlainTextDocumentLayout(document))
+    if longlines.has_long_line(text):
+        longlines.insert_chunked(QTextCursor(document), text)
+    elif text:
+        document.setPlainText(text)
+    return document
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class OpenDocument:
+    """ A file open in a tab: its live document while cached, a compressed snapshot once evicted """
+
+    def __init__(self, path):
+        self.path = path
+        self.document = None
+        self.highlighter = None
+        self.viewer = None  # PagedFileViewer shown instead of a document for huge files, HexViewer for binary ones
+        self.encoding = "utf-8"  # Detected when the file is opened, and kept when saving
+        self.lossy = False  # Bytes that didn't decode were replaced, so it is read-only: saving would write the replacements
+        self.journal = None  # EditJournal logging the live document's unsaved edits
+
+        self.snapshot = None  # zlib-compressed UTF-8 text of an evicted document
+        self.snapshot_mtime = None  # mtime of the file when the snapshot was taken
+
+        # Where the view was, restored when the tab is shown again
+        self.cursor_position = 0
+        self.scroll_position = 0
+
+    def memory_estimate(self):
+        if self.document is None:
+            return len(self.snapshot) if self.snapshot is not None else 0
+        return self.document.characterCount() * CHAR_BYTES + self.document.blockCount() * BLOCK_BYTES
+
+    def evict(self):
+        """ Replaces the document with a compressed snapshot of its text """
+        text = longlines.plain_text(self.document)
+        self.snapshot = zlib.compress(text.encode("utf-8"), 1)  # Fastest level, restoring has to feel instant
+        self.snapshot_mtime = file_mtime(self.path)
+
+        if self.journal is not None:
+            self.journal.detach()  # Unmodified, so it has nothing to keep
+            self.journal = None
+
+        # The highlighter is a child of the document and goes with it
+        self.document.deleteLater()
+        self.document = None
+        self.highlighter = None
+
+    def snapshot_is_current(self):
+        """ Whether the snapshot still matches the file, it is stale if something else changed it """
+        return self.snapshot is not None and file_mtime(self.path) == self.snapshot_mtime
+
+    def restore(self):
+        """ Rebuilds the document from the snapshot """
+        self.document = new_document(zlib.decompress(self.snapshot).decode("utf-8"))
+        self.document.setModified(False)
+        self.snapshot = None
+        self.snapshot_mtime = None
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.discard()  # Saved or thrown away, either way nothing to recover
+            self.journal.detach()
+            self.journal = None
+        if self.viewer is not None:
+            self.viewer.close_file()
+            self.viewer.deleteLater()
+        if self.document is not None:
+            self.document.deleteLater()
+        self.document = None
+        self.highlighter = None
+        self.viewer = None
+        self.snapshot = None
+
+
+class DocumentCache:
+    """ The open files in least recently used order, keeping live documents within a memory budget.
+
+    trim evicts the least recently used documents to snapshots until the estimate fits the budget.
+    Documents with unsaved changes are never evicted, and neither is anything the caller protects.
+    """
+
+    def __init__(self, budget_bytes):
+        self.budget_bytes = budget_bytes
+        self.open_documents = OrderedDict()  # Path -> OpenDocument, most recently used last
+
+    def __len__(self):
+        return len(self.open_documents)
+
+    def get(self, path):
+        return self.open_documents.get(path)
+
+    def add(self, open_document):
+        self.open_documents[open_document.path] = open_document
+
+    def remove(self, path):
+        return self.open_documents.pop(path, None)
+
+    def touch(self, path):
+        self.open_documents.move_to_end(path)
+
+    def memory_estimate(self):
+        return sum(open_document.memory_estimate() for open_document in self.open_documents.values())
+
+    def trim(self, can_evict=lambda open_document: True):
+        """ Evicts documents, oldest first, until the cache fits its budget. Returns the evicted ones """
+        total = self.memory_estimate()
+        evicted = []
+        for open_document in list(self.open_documents.values()):
+            if total <= self.budget_bytes:
+                break
+            if open_document.document is None or open_document.document.isModified() or not can_evict(open_document):
+                continue
+
+            before = open_document.memory_estimate()
+            open_document.evict()
+            total -= before - open_document.memory_estimate()
+            evicted.append(open_document)
+        return evicted
@@ -1,10 +1,16 @@
-from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtGui import QPainter, QColor, QStaticText, QTransform
 from PyQt5.QtWidgets import QWidget
-from PyQt5.QtCore import QRect, QSize, Qt
+from PyQt5.QtCore import QEvent, QMimeData, QPointF, QRect, QSize, Qt, pyqtSignal
 from PyQt5.QtWidgets import QPlainTextEdit
 from PyQt5.QtGui import QFontMetricsF
 
-		
+import longlines
+
+GUTTER_BACKGROUND = QColor("#1e2127")  # Background color for the line number area
+LINE_NUMBER_COLOR = QColor("#abb2bf")
+CURRENT_LINE_NUMBER_COLOR = QColor("#e6e6e6")  # Brighter number for the line the cursor is on
+
+
 class LineNumberArea(QWidget):
     def __init__(self, editor):
         super().__init__(editor)
@@ -17,32 +23,144 @@ class LineNumberArea(QWidget):
         self.editor.line_number_paint_event(event)
 
 class CodeEditor(QPlainTextEdit):
+    MAX_CACHED_NUMBERS = 4096  # Pre-rendered line numbers kept around for repainting
+
+    long_line_mode_changed = pyqtSignal(bool)
+
     def __init__(self):
         super().__init__()
 
         self.line_number_area = LineNumberArea(self)
-        
+        self.first_line_number = 1  # Number shown for the first block, views of part of a file start later
+
+        # Long-line mode: the document splits long lines over several blocks, numbered as the lines they are part of
+        self.line_map = None
+        self.wrap_mode_before = None  # Wrap mode to go back to when long-line mode ends
+
+        # Font metrics and pre-rendered numbers, rebuilt when the font changes
+        self.number_cache = {}
+        self.line_height = 0
+        self.digit_width = 0
+        self.gutter_digits = 0
+        self.current_line = -1  # Block whose number is painted highlighted
+        self.update_font_metrics()
+
         # Connect events to update the line numbers dynamically
         self.blockCountChanged.connect(self.update_line_number_width)
         self.updateRequest.connect(self.update_line_number_area_on_scroll)
-        self.cursorPositionChanged.connect(self.viewport().update)
+        self.cursorPositionChanged.connect(self.update_current_line_number)
 
         # Adjust margins initially
         self.update_line_number_width()
 
     def line_number_width(self):
-        digits = max(1, len(str(self.blockCount())))
-        return 10 + self.fontMetrics().width('9') * digits
-    
+        return 10 + self.digit_width * max(1, self.gutter_digits)
+
+    def update_font_metrics(self):
+        """ Caches the metrics used to lay out line numbers and drops numbers rendered in the old font """
+        metrics = self.fontMetrics()
+        self.line_height = metrics.height()
+        self.digit_width = metrics.width('9')
+        self.number_cache.clear()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.FontChange:
+            self.update_font_metrics()
+            self.gutter_digits = 0  # Forces the margin to be recomputed with the new digit width
+            self.update_line_number_width()
+
     def update_tab_size(self):
         """ Dynamically update tab size based on font size """
         metrics = QFontMetricsF(self.font())
         tab_width = metrics.horizontalAdvance(" ") * 4
         self.setTabStopDistance(tab_width)
 
+    def set_document(self, document):
+        """ Shows another document in the editor, in the editor's font and with the gutter redone for it """
+        document.setDefaultFont(self.font())
+        self.setDocument(document)
+        self.gutter_digits = 0
+        self.current_line = -1
+        self.update_long_line_mode()
+        self.update_line_number_width()
+        self.line_number_area.update()
+
+    def update_long_line_mode(self):
+        """ Turns wrapping off while the document is in long-line mode, its blocks are already at most a chunk long """
+        line_map = longlines.line_map(self.document())
+        if (line_map is None) == (self.line_map is None):
+            self.line_map = line_map
+            return
+
+        self.line_map = line_map
+        if line_map is not None:
+            self.wrap_mode_before = self.lineWrapMode()
+            self.setLineWrapMode(QPlainTextEdit.NoWrap)
+        else:
+            self.setLineWrapMode(self.wrap_mode_before)
+        self.line_number_area.update()
+        self.long_line_mode_changed.emit(line_map is not None)
+
+    def createMimeDataFromSelection(self):
+        """ Copies long lines whole, the soft breaks splitting them stay out of the clipboard """
+        if self.line_map is None:
+            return super().createMimeDataFromSelection()
+        mime_data = QMimeData()
+        mime_data.setText(longlines.selected_text(self.textCursor()))
+        return mime_data
+
+    def insertFromMimeData(self, source):
+        """ Pastes text with long lines in chunks, putting the document in long-line mode """
+        text = source.text().replace("\r\n", "\n").replace("\r", "\n") if source.hasText() else ""
+        cursor = self.textCursor()
+        column = cursor.selectionStart() - cursor.document().findBlock(cursor.selectionStart()).position()
+        if not longlines.has_long_line(text, column):
+            super().insertFromMimeData(source)
+            return
+
+        cursor.beginEditBlock()
+        cursor.removeSelectedText()
+        longlines.insert_chunked(cursor, text)
+        cursor.endEditBlock()
+        self.setTextCursor(cursor)
+        self.update_long_line_mode()
+
+    def keyPressEvent(self, event):
+        # A soft break is invisible, so Backspace and Delete next to one remove the character on its other side
+        cursor = self.textCursor()
+        if self.line_map is not None and event.modifiers() == Qt.NoModifier and not cursor.hasSelection():
+            block = cursor.block()
+            following = block.next()
+            if event.key() == Qt.Key_Backspace and cursor.atBlockStart() and longlines.is_continuation(block) \
+                    and block.previous().length() > 1:
+                cursor.setPosition(cursor.position() - 1)
+                cursor.deletePreviousChar()
+                return
+            if event.key() == Qt.Key_Delete and cursor.atBlockEnd() and following.isValid() \
+                    and longlines.is_continuation(following) and following.length() > 1:
+                cursor.setPosition(cursor.position() + 1)
+                cursor.deleteChar()
+                return
+        super().keyPressEvent(event)
+
+    def set_first_line_number(self, number):
+        """ Numbers the first block as line number, for views that show part of a file """
+        self.first_line_number = number
+        self.update_line_number_width()
+
     def update_line_number_width(self):
-        """Adjust the left margin to make space for line numbers."""
-        self.setViewportMargins(self.line_number_width(), 0, 0, 0)
+        """Adjust the left margin to make space for line numbers, only when the digit count changes."""
+        digits = len(str(self.blockCount() + self.first_line_number - 1))
+        if digits == self.gutter_digits:
+            return
+
+        self.gutter_digits = digits
+        width = self.line_number_width()
+        self.setViewportMargins(width, 0, 0, 0)
+
+        rect = self.contentsRect()
+        self.line_number_area.setGeometry(QRect(rect.left(), rect.top(), width, rect.height()))
         self.line_number_area.update()
 
     def resizeEvent(self, event):
@@ -52,27 +170,64 @@ class CodeEditor(QPlainTextEdit):
         self.line_number_area.setGeometry(QRect(rect.left(), rect.top(), self.line_number_width(), rect.height()))
 
     def update_line_number_area_on_scroll(self, rect, dy):
-        """Keep line numbers in sync with scrolling."""
+        """Keep line numbers in sync with scrolling, repainting only the rows that changed."""
         if dy:
             self.line_number_area.scroll(0, dy)
         else:
-            self.line_number_area.update()
+            self.line_number_area.update(0, rect.y(), self.line_number_area.width(), rect.height())
+
+    def update_current_line_number(self):
+        """ Repaints the gutter rows of the old and new current line when the cursor changes lines """
+        number = self.textCursor().blockNumber()
+        if number == self.current_line:
+            return
+
+        previous, self.current_line = self.current_line, number
+        for block_number in (previous, number):
+            block = self.document().findBlockByNumber(block_number)
+            if block.isValid() and block.isVisible():
+                top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+                self.line_number_area.update(0, int(top), self.line_number_area.width(), self.line_height)
+
+    def rendered_number(self, number):
+        """ Returns a prepared QStaticText for a line number and its width, cached between paints """
+        cached = self.number_cache.get(number)
+        if cached is None:
+            if len(self.number_cache) >= self.MAX_CACHED_NUMBERS:
+                self.number_cache.clear()
+            text = QStaticText(str(number))
+            text.setTextFormat(Qt.PlainText)
+            text.prepare(QTransform(), self.font())
+            cached = self.number_cache[number] = (text, text.size().width())
+        return cached
 
     def line_number_paint_event(self, event):
-        """Paint the line numbers in the margin."""
+        """Paint the line numbers in the damaged part of the margin."""
         painter = QPainter(self.line_number_area)
-        painter.fillRect(event.rect(), QColor("#1e2127"))  # Background color for the line number area
+        painter.setFont(self.font())
+        rect = event.rect()
+        painter.fillRect(rect, GUTTER_BACKGROUND)
+
+        right = self.line_number_area.width() - 5
+        painter.setPen(LINE_NUMBER_COLOR)
 
         block = self.firstVisibleBlock()
         block_number = block.blockNumber()
         top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
         bottom = top + self.blockBoundingRect(block).height()
 
-        while block.isValid() and top <= event.rect().bottom():
-            if block.isVisible() and bottom >= event.rect().top():
-                number = str(block_number + 1)
-                painter.setPen(QColor("#abb2bf"))  # Line number color
-                painter.drawText(0, int(top), self.line_number_area.width() - 5, self.fontMetrics().height(), Qt.AlignRight, number)
+        while block.isValid() and top <= rect.bottom():
+            # In long-line mode a line is only numbered on the block it starts in
+            continuation = self.line_map is not None and longlines.is_continuation(block)
+            if block.isVisible() and bottom >= rect.top() and not continuation:
+                line = self.line_map.line_of_block(block_number) if self.line_map is not None else block_number
+                text, width = self.rendered_number(line + self.first_line_number)
+                if block_number == self.current_line:
+                    painter.setPen(CURRENT_LINE_NUMBER_COLOR)
+                    painter.drawStaticText(QPointF(right - width, top), text)
+                    painter.setPen(LINE_NUMBER_COLOR)
+                else:
+                    painter.drawStaticText(QPointF(right - width, top), text)
 
             block = block.next()
             top = bottom
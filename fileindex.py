@@ -0,0 +1,341 @@
+from PyQt5.QtCore import QObject, QThread, QStandardPaths, QFileSystemWatcher, pyqtSignal
+import itertools
+import hashlib
+import bisect
+import heapq
+import queue
+import json
+import os
+import re
+
+import workspace
+
+CACHE_VERSION = 1
+
+
+def cache_path(root):
+    """ Where the index of a workspace is cached between runs """
+    folder = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), "qwerty", "file-index")
+    return os.path.join(folder, hashlib.sha1(root.encode("utf-8")).hexdigest()[:16] + ".json")
+
+
+def build_lookup(paths):
+    """ What WorkspaceIndex.search scans: the paths shortest first, their lowercased text one per line and
+    where each line starts, the same for their file names (after a leading newline), and their lengths """
+    ordered = sorted(paths, key=len)  # Stable, so paths of one length stay in alphabetical order
+    lines = [path.lower() for path in ordered]
+    names = [line[line.rfind("/") + 1:] for line in lines]
+    starts = list(itertools.accumulate((len(line) + 1 for line in lines), initial=0))
+    name_starts = list(itertools.accumulate((len(name) + 1 for name in names), initial=1))
+    return ordered, "\n".join(lines), starts, "\n" + "\n".join(names), name_starts, [len(path) for path in ordered]
+
+
+class FileIndexer(QThread):
+    """ Walks a workspace on a background thread and keeps a listing of every directory in it.
+
+    Listings are keyed by directory mtime, so a warm start from the on-disk cache only stats
+    directories and re-lists the ones that changed.
+    """
+
+    indexed = pyqtSignal(object, object, object)  # Sorted relative paths, build_lookup of them, directories to watch
+
+    def __init__(self, root, excludes, parent=None):
+        super().__init__(parent)
+        self.root = os.path.normpath(root)
+        self.rules = workspace.IgnoreRules(self.root, excludes)
+        self.requests = queue.Queue()  # Directories to rescan, None to stop
+
+        self.listings = {}  # Relative dir -> [mtime_ns, file names, subdirectory names], unfiltered
+        self.visible = {}  # Relative dir -> (files, subdirectories) that aren't ignored
+
+    def rescan(self, directory):
+        """ Re-lists a directory that changed on disk """
+        self.requests.put(directory)
+
+    def stop(self):
+        self.requestInterruption()
+        self.requests.put(None)
+
+    def run(self):
+        cached = self.load_cache()
+        self.walk("", cached)
+        if self.isInterruptionRequested():
+            return
+        self.publish()
+        self.save_cache()
+
+        while True:
+            directory = self.requests.get()
+            changed = set()
+            # Take everything that queued up, a burst of watcher events becomes one update
+            while directory is not None:
+                changed.add(directory)
+                try:
+                    directory = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+            if directory is None or self.isInterruptionRequested():
+                self.save_cache()
+                return
+
+            for path in changed:
+                self.rescan_directory(path)
+            self.publish()
+
+    def relative(self, path):
+        path = os.path.relpath(os.path.normpath(path), self.root)
+        return "" if path == "." else path.replace(os.sep, "/")
+
+    def absolute(self, relative):
+        return os.path.join(self.root, *relative.split("/")) if relative else self.root
+
+    def list_directory(self, relative):
+        """ Returns [mtime_ns, files, subdirectories] of a directory, None if it is gone """
+        full = self.absolute(relative)
+        files = []
+        subdirectories = []
+        try:
+            mtime = os.stat(full).st_mtime_ns
+            with os.scandir(full) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.append(entry.name)
+                        elif not entry.is_symlink() or not entry.is_dir():  # Links to directories could loop
+                            files.append(entry.name)
+                    except OSError:
+                        pass
+        except OSError:
+            return None
+        return [mtime, files, subdirectories]
+
+    def walk(self, relative, cached):
+        """ Indexes a directory tree, reusing cached listings whose mtime still matches """
+        stack = [relative]
+        while stack and not self.isInterruptionRequested():
+            relative = stack.pop()
+            try:
+                mtime = os.stat(self.absolute(relative)).st_mtime_ns
+            except OSError:
+                continue
+
+            listing = cached.get(relative)
+            if listing is None or listing[0] != mtime:
+                listing = self.list_directory(relative)
+                if listing is None:
+                    continue
+            self.listings[relative] = listing
+
+            base = self.absolute(relative)
+            files = [name for name in listing[1] if not self.rules.is_ignored(os.path.join(base, name), False)]
+            subdirectories = [name for name in listing[2] if not self.rules.is_ignored(os.path.join(base, name), True)]
+            self.visible[relative] = (files, subdirectories)
+
+            prefix = relative + "/" if relative else ""
+            stack.extend(prefix + name for name in subdirectories)
+
+    def forget(self, relative):
+        """ Drops a directory and everything below it from the index """
+        prefix = relative + "/"
+        for key in [key for key in self.listings if key == relative or key.startswith(prefix)]:
+            del self.listings[key]
+            self.visible.pop(key, None)
+
+    def rescan_directory(self, path):
+        relative = self.relative(path)
+        if relative.startswith("..") or relative not in self.listings:
+            return
+
+        old_subdirectories = set(self.visible.get(relative, ((), ()))[1])
+        self.listings.pop(relative)
+        self.walk_changed(relative, old_subdirectories)
+
+    def walk_changed(self, relative, old_subdirectories):
+        """ Re-lists one directory, walking new subdirectories and dropping removed ones """
+        listing = self.list_directory(relative)
+        if listing is None:
+            self.forget(relative)
+            return
+
+        prefix = relative + "/" if relative else ""
+        base = self.absolute(relative)
+        self.listings[relative] = listing
+        files = [name for name in listing[1] if not self.rules.is_ignored(os.path.join(base, name), False)]
+        subdirectories = [name for name in listing[2] if not self.rules.is_ignored(os.path.join(base, name), True)]
+        self.visible[relative] = (files, subdirectories)
+
+        for name in old_subdirectories - set(subdirectories):
+            self.forget(prefix + name)
+        for name in set(subdirectories) - old_subdirectories:
+            self.walk(prefix + name, {})
+
+    def publish(self):
+        paths = []
+        for relative, (files, _) in self.visible.items():
+            prefix = relative + "/" if relative else ""
+            paths.extend(prefix + name for name in files)
+        paths.sort()
+        self.indexed.emit(paths, build_lookup(paths), [self.absolute(relative) for relative in self.visible])
+
+    def load_cache(self):
+        try:
+            with open(cache_path(self.root), "r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != CACHE_VERSION or data.get("root") != self.root:
+            return {}
+        return data.get("listings", {})
+
+    def save_cache(self):
+        path = cache_path(self.root)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"version": CACHE_VERSION, "root": self.root, "listings": self.listings}, file, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # The cache only speeds up the next start
+
+
+class WorkspaceIndex(QObject):
+    """ Index of the files in the workspace, kept up to date in the background, with fuzzy lookup """
+
+    updated = pyqtSignal()
+
+    MAX_WATCHED_DIRECTORIES = 4096  # Stay well inside the OS limit on watches
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.root = None
+        self.indexer = None
+        self.watcher = None
+        self.ready = False  # Whether the first walk of the workspace is done
+
+        self.paths = []  # Relative paths with "/" separators, sorted
+        self.lookup = build_lookup([])  # The paths shortest first, searched in one regex pass per kind of match
+
+        # The last lookup, refined instead of redone while the query only grows
+        self.last_query = None
+        self.last_scans = {}
+
+    def set_root(self, root, excludes):
+        self.stop()
+        self.root = os.path.normpath(root)
+        self.ready = False
+        self.paths = []
+        self.lookup = build_lookup([])
+        self.last_scans = {}
+
+        self.watcher = QFileSystemWatcher(self)
+        self.indexer = FileIndexer(self.root, excludes)
+        self.indexer.indexed.connect(self.index_updated)
+        self.watcher.directoryChanged.connect(self.indexer.rescan)
+        self.indexer.start()
+
+    def stop(self):
+        if self.indexer is not None:
+            self.indexer.stop()
+            self.indexer.wait()
+            self.indexer.deleteLater()
+            self.indexer = None
+        if self.watcher is not None:
+            self.watcher.deleteLater()
+            self.watcher = None
+
+    def index_updated(self, paths, lookup, directories):
+        if self.sender() is not self.indexer:
+            return
+
+        self.ready = True
+        self.paths = paths
+        self.lookup = lookup
+        self.last_scans = {}
+
+        # Directory events keep the index current, watched up to the limit
+        watched = set(self.watcher.directories())
+        wanted = set(directories[:self.MAX_WATCHED_DIRECTORIES])
+        if watched - wanted:
+            self.watcher.removePaths(list(watched - wanted))
+        if wanted - watched:
+            self.watcher.addPaths(list(wanted - watched))
+        self.updated.emit()
+
+    def absolute(self, relative):
+        return os.path.join(self.root, *relative.split("/"))
+
+    def search(self, query, limit=50):
+        """ Returns up to limit relative paths ranked by how well they fuzzy-match query.
+
+        Paths are ranked by score(): what kind of match they are, then their length. Each kind is looked
+        for in turn, best first, and as the lookup holds the paths shortest first, the first limit matches
+        of a kind are its best ones. Once the list is full, a kind is only looked for in paths short enough
+        to make it, so the scans stop early however many paths match. While the query grows, each scan
+        picks up where the last query's stopped, checking only the paths that query found before there.
+        """
+        query = query.strip().lower().replace("\\", "/")
+        if not query:
+            return self.paths[:limit]
+
+        ordered, haystack, starts, names, name_starts, lengths = self.lookup
+
+        def find_name_start(position, end):
+            index = names.find("\n" + query, position - 1, end)
+            return index + 1 if index >= 0 else -1
+
+        # [^c\n]*c jumps straight to the next c, so the scan runs without backtracking
+        search = re.compile(re.escape(query[0]) + "".join(f"[^{re.escape(c)}\n]*{re.escape(c)}" for c in query[1:])).search
+
+        def find_fuzzy(position, end):
+            match = search(haystack, position, end)
+            return match.start() if match is not None else -1
+
+        # Kinds of match with the score they add and how to find the next one between two positions, each
+        # a subset of the next. The literal ones use str.find, which is many times faster than a regex
+        kinds = [(500, starts, lambda position, end: haystack.find(query, position, end)), (0, starts, find_fuzzy)]
+        if "/" not in query:
+            kinds[:0] = [(1500, name_starts, find_name_start),
+                         (1000, name_starts, lambda position, end: names.find(query, position, end))]
+
+        previous = self.last_scans if self.last_query is not None and query.startswith(self.last_query) else {}
+        scans = {}  # Kind -> (lines found, line the scan got up to)
+        found = set()
+        best = []
+        for bonus, line_starts, find in kinds:
+            end_line = len(ordered)
+            if len(best) == limit:
+                # Longer paths of this kind score below the last path on the list
+                end_line = bisect.bisect_right(lengths, bonus - self.score(best[-1], query))
+
+            # Up to where the last query's scan got, only the paths it found can match
+            last_lines, scanned_to = previous.get(bonus, ((), 0))
+            lines = [line for line in last_lines if line < end_line and find(line_starts[line], line_starts[line + 1] - 1) >= 0][:limit]
+
+            position = line_starts[min(scanned_to, end_line)]
+            end = line_starts[end_line]
+            while len(lines) < limit:
+                start = find(position, end)
+                if start < 0:
+                    break
+                line = bisect.bisect_right(line_starts, start) - 1
+                lines.append(line)
+                position = line_starts[line + 1]
+
+            scans[bonus] = (lines, lines[-1] + 1 if len(lines) == limit else end_line)
+            found.update(lines)
+            best = heapq.nlargest(limit, (ordered[line] for line in sorted(found)), key=lambda path: self.score(path, query))
+
+        self.last_query = query
+        self.last_scans = scans
+        return best
+
+    @staticmethod
+    def score(path, query):
+        """ Higher is better: the query in the file name, at its start, then shorter paths """
+        name = path[path.rfind("/") + 1:].lower()
+        score = -len(path)
+        if query in name:
+            score += 1000 + (500 if name.startswith(query) else 0)
+        elif query in path.lower():
+            score += 500
+        return score
@@ -0,0 +1,365 @@
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QScrollBar, QAbstractScrollArea, QAbstractSlider
+from PyQt5.QtCore import QThread, Qt, pyqtSignal
+from PyQt5.QtGui import QPainter, QPalette, QColor, QFontDatabase
+import threading
+import codecs
+import mmap
+import os
+
+import editorarea
+import documents
+
+# Files at least this big are shown in the read-only paged viewer instead of being loaded into the editor
+PAGED_THRESHOLD_BYTES = 64 * 1024 * 1024
+
+SNIFF_BYTES = 8192  # How much of a file is looked at to tell binary from text and guess the encoding
+
+# UTF-32 comes first, its little-endian BOM starts with UTF-16's. The codecs named consume the BOM
+BOMS = ((codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"), (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+
+# Control characters text doesn't have, tabs, newlines, form feeds, backspaces and escapes aside
+CONTROL_BYTES = bytes(byte for byte in range(32) if byte not in b"\t\n\r\f\b\x0b\x1b")
+
+# Legacy 8-bit encodings, Windows-1252 is the likeliest and Latin-1 decodes anything
+LEGACY_ENCODINGS = ("cp1252", "latin-1")
+
+
+def sniff(path):
+    """ Looks at the start of a file and returns ("text", encoding) or ("binary", None) """
+    with open(path, "rb") as file:
+        sample = file.read(SNIFF_BYTES)
+
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return "text", encoding
+
+    if b"\0" in sample:
+        # UTF-16 without a BOM: mostly ASCII text leaves every other byte NUL
+        half = len(sample) // 2
+        even, odd = sample[0::2].count(0), sample[1::2].count(0)
+        if half >= 4 and even == 0 and odd >= half * 0.9:
+            return "text", "utf-16-le"
+        if half >= 4 and odd == 0 and even >= half * 0.9:
+            return "text", "utf-16-be"
+        return "binary", None
+
+    try:
+        # A multi-byte character cut off at the end of the sample is still valid UTF-8
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < SNIFF_BYTES)
+        return "text", "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    if len(sample) - len(sample.translate(None, CONTROL_BYTES)) > len(sample) * 0.1:
+        return "binary", None
+
+    for encoding in LEGACY_ENCODINGS:
+        try:
+            sample.decode(encoding)
+            return "text", encoding
+        except UnicodeDecodeError:
+            pass
+
+
+def fallback_encoding(encoding):
+    """ The encoding to try next for a file that isn't valid in encoding past its sniffed start, None if there is none """
+    chain = ("utf-8",) + LEGACY_ENCODINGS
+    names = [codecs.lookup(name).name for name in chain]
+    name = codecs.lookup(encoding).name
+    return chain[names.index(name) + 1] if name in names[:-1] else None
+
+
+def ascii_compatible(encoding):
+    """ Whether newlines are single b"\\n" bytes in the encoding, which the paged viewer relies on """
+    return not codecs.lookup(encoding).name.startswith(("utf-16", "utf-32"))
+
+
+class FileReader(QThread):
+    """ Reads and decodes a file on a background thread, handing the text over in chunks.
+
+    Only the start of a file is sniffed, so the rest can turn out not to be in its encoding. With
+    errors="strict" the reader then stops and emits undecodable instead of replacing the bytes.
+    """
+
+    chunk_read = pyqtSignal(str)
+    progress = pyqtSignal(int, int)  # Bytes read so far, total bytes
+    finished_reading = pyqtSignal()
+    undecodable = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    CHUNK_BYTES = 256 * 1024
+    CHUNKS_IN_FLIGHT = 4  # Chunks the GUI may have queued before the reader waits for it
+
+    def __init__(self, path, encoding="utf-8", errors="strict", parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.encoding = encoding
+        self.errors = errors
+        self.in_flight = threading.Semaphore(self.CHUNKS_IN_FLIGHT)
+
+    def chunk_consumed(self):
+        """ Called by the GUI once it has inserted a chunk, lets the reader send another """
+        self.in_flight.release()
+
+    def cancel(self):
+        self.requestInterruption()
+        self.in_flight.release()  # Wake the reader up if it is waiting on the GUI
+
+    def run(self):
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors=self.errors)
+        pending_cr = ""  # A '\r' at the end of a chunk may be the first half of '\r\n'
+
+        try:
+            total = os.path.getsize(self.path)
+            done = 0
+            with open(self.path, "rb") as file:
+                while not self.isInterruptionRequested():
+                    data = file.read(self.CHUNK_BYTES)
+                    final = not data
+                    text = pending_cr + decoder.decode(data, final)
+                    pending_cr = ""
+
+                    if text.endswith("\r") and not final:
+                        text, pending_cr = text[:-1], "\r"
+                    # Same universal newlines as reading the file in text mode
+                    text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+                    if text:
+                        self.in_flight.acquire()
+                        if self.isInterruptionRequested():
+                            return
+                        self.chunk_read.emit(text)
+
+                    done += len(data)
+                    self.progress.emit(done, total)
+                    if final:
+                        break
+        except UnicodeDecodeError:
+            self.undecodable.emit()
+            return
+        except (OSError, LookupError) as e:
+            self.failed.emit(str(e))
+            return
+
+        if not self.isInterruptionRequested():
+            self.finished_reading.emit()
+
+
+class PagedFileViewer(QWidget):
+    """ Read-only view of a huge file that keeps only a window of its lines in the editor.
+
+    The file is memory-mapped, so memory use doesn't grow with the file size. The outer scroll bar
+    moves the window through the file, scrolling off either end of the editor slides it along.
+    """
+
+    WINDOW_BYTES = 512 * 1024
+    CHECKPOINT_BYTES = 16 * 1024 * 1024  # Spacing of the cached line counts used for line numbers
+    SCROLL_UNIT_BYTES = 1024  # QScrollBar ranges are ints, so the outer bar counts KiB
+
+    def __init__(self, path, encoding="utf-8", parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.encoding = encoding
+
+        self.file = open(path, "rb")
+        self.size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.line_checkpoints = [0]  # Newlines before each multiple of CHECKPOINT_BYTES
+
+        self.document = None  # Text of the window, replaced as it slides
+        self.start = 0
+        self.end = 0
+        self.loading = False
+
+        self.editor = editorarea.CodeEditor()
+        self.editor.setReadOnly(True)
+        self.editor.setLineWrapMode(editorarea.CodeEditor.NoWrap)
+        self.editor.verticalScrollBar().valueChanged.connect(self.editor_scrolled)
+
+        self.scroll_bar = QScrollBar(Qt.Vertical)
+        self.scroll_bar.setRange(0, max(0, (self.size - 1) // self.SCROLL_UNIT_BYTES))
+        self.scroll_bar.setPageStep(max(1, self.WINDOW_BYTES // self.SCROLL_UNIT_BYTES))
+        self.scroll_bar.valueChanged.connect(lambda value: self.load_window(value * self.SCROLL_UNIT_BYTES))
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.editor)
+        layout.addWidget(self.scroll_bar)
+
+        self.load_window(0)
+
+    def close_file(self):
+        """ Releases the memory map and the file handle """
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+    def line_start(self, offset):
+        """ Returns the start of the line containing offset, or offset itself inside a very long line """
+        if offset <= 0:
+            return 0
+        newline = self.map.rfind(b"\n", max(0, offset - self.WINDOW_BYTES), offset)
+        return newline + 1 if newline >= 0 else offset
+
+    def line_number_at(self, offset):
+        """ Counts the lines before offset, caching counts every CHECKPOINT_BYTES so jumps stay cheap """
+        checkpoint = offset // self.CHECKPOINT_BYTES
+        while len(self.line_checkpoints) <= checkpoint:
+            start = (len(self.line_checkpoints) - 1) * self.CHECKPOINT_BYTES
+            count = self.map[start:start + self.CHECKPOINT_BYTES].count(b"\n")
+            self.line_checkpoints.append(self.line_checkpoints[-1] + count)
+
+        start = checkpoint * self.CHECKPOINT_BYTES
+        return self.line_checkpoints[checkpoint] + self.map[start:offset].count(b"\n")
+
+    def line_offset(self, line):
+        """ Returns the offset where a line (counted from 0) starts, counting forward from the nearest checkpoint """
+        checkpoint = 0
+        while (checkpoint + 1) * self.CHECKPOINT_BYTES < self.size and self.line_number_at((checkpoint + 1) * self.CHECKPOINT_BYTES) <= line:
+            checkpoint += 1
+
+        offset = checkpoint * self.CHECKPOINT_BYTES
+        for _ in range(line - self.line_checkpoints[checkpoint]):
+            newline = self.map.find(b"\n", offset)
+            if newline < 0:
+                break
+            offset = newline + 1
+        return offset
+
+    def go_to_line(self, line):
+        self.load_window(self.line_offset(line))
+
+    def decode(self, start, end):
+        return self.map[start:end].decode(self.encoding, errors="replace").replace("\r\n", "\n")
+
+    def load_window(self, offset, first_visible_position=0):
+        """ Shows the lines starting at (or just before) offset, scrolled to the block at a position in the window's text """
+        start = self.line_start(min(offset, self.size))
+        end = min(self.size, start + self.WINDOW_BYTES)
+        if end < self.size:
+            newline = self.map.find(b"\n", end, end + self.WINDOW_BYTES)
+            end = newline + 1 if newline >= 0 else end
+
+        self.start, self.end = start, end
+
+        self.loading = True  # Setting the text scrolls the editor, which mustn't slide the window again
+        self.document = documents.new_document(self.decode(start, end))  # Long lines split over blocks, as in the editor
+        self.editor.set_document(self.document)
+        self.editor.set_first_line_number(self.line_number_at(start) + 1)
+        block = self.document.findBlock(min(first_visible_position, self.document.characterCount() - 1))
+        self.editor.verticalScrollBar().setValue(block.blockNumber())
+        self.loading = False
+
+        self.scroll_bar.blockSignals(True)
+        self.scroll_bar.setValue(start // self.SCROLL_UNIT_BYTES)
+        self.scroll_bar.blockSignals(False)
+
+    def editor_scrolled(self, value):
+        """ Slides the window along when the editor is scrolled to either end of it """
+        if self.loading:
+            return
+
+        editor_bar = self.editor.verticalScrollBar()
+        first_position = self.editor.firstVisibleBlock().position()
+
+        if value >= editor_bar.maximum() and self.end < self.size:
+            # Keep the second half of the window and the current line in view
+            new_start = self.line_start(self.start + self.WINDOW_BYTES // 2)
+            if new_start <= self.start:
+                new_start = self.end
+            skipped = len(self.decode(self.start, new_start))
+            self.load_window(new_start, max(0, first_position - skipped))
+        elif value <= editor_bar.minimum() and self.start > 0:
+            new_start = self.line_start(max(0, self.start - self.WINDOW_BYTES // 2))
+            added = len(self.decode(new_start, self.start))
+            self.load_window(new_start, first_position + added)
+
+
+class HexViewer(QAbstractScrollArea):
+    """ Read-only hex dump of a binary file.
+
+    The file is memory-mapped and only the rows in view are read and drawn, so opening and scrolling
+    cost the same for a file of any size.
+    """
+
+    BYTES_PER_ROW = 16
+    PRINTABLE = bytes(byte if 32 <= byte < 127 else ord(".") for byte in range(256))  # Translation table for the text column
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+        self.file = open(path, "rb")
+        self.size = os.path.getsize(path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        self.rows = (self.size + self.BYTES_PER_ROW - 1) // self.BYTES_PER_ROW
+        self.offset_digits = max(8, len(f"{self.size:x}"))
+
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.verticalScrollBar().setSingleStep(1)
+        self.update_scroll_range()
+
+    def close_file(self):
+        """ Releases the memory map and the file handle """
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+    def visible_rows(self):
+        return max(1, self.viewport().height() // self.fontMetrics().height())
+
+    def update_scroll_range(self):
+        # QScrollBar ranges are ints, past 32 GiB the end of the file is out of reach
+        bar = self.verticalScrollBar()
+        bar.setRange(0, min(max(0, self.rows - self.visible_rows()), 2 ** 31 - 1))
+        bar.setPageStep(self.visible_rows())
+
+    def go_to_line(self, row):
+        self.verticalScrollBar().setValue(row)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_scroll_range()
+
+    def scrollContentsBy(self, dx, dy):
+        self.viewport().update()
+
+    def keyPressEvent(self, event):
+        actions = {
+            Qt.Key_Up: QAbstractSlider.SliderSingleStepSub,
+            Qt.Key_Down: QAbstractSlider.SliderSingleStepAdd,
+            Qt.Key_PageUp: QAbstractSlider.SliderPageStepSub,
+            Qt.Key_PageDown: QAbstractSlider.SliderPageStepAdd,
+            Qt.Key_Home: QAbstractSlider.SliderToMinimum,
+            Qt.Key_End: QAbstractSlider.SliderToMaximum,
+        }
+        if event.key() in actions:
+            self.verticalScrollBar().triggerAction(actions[event.key()])
+        else:
+            super().keyPressEvent(event)
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        metrics = self.fontMetrics()
+        offset_width = metrics.horizontalAdvance("0" * (self.offset_digits + 2))
+        text_color = self.palette().color(QPalette.Text)
+        offset_color = QColor("#5c6370")
+
+        first = self.verticalScrollBar().value()
+        for i in range(self.visible_rows() + 1):
+            offset = (first + i) * self.BYTES_PER_ROW
+            if offset >= self.size:
+                break
+            data = self.map[offset:offset + self.BYTES_PER_ROW]
+            half = self.BYTES_PER_ROW // 2
+            hex_column = f"{data[:half].hex(' ')}  {data[half:].hex(' ')}"
+            y = i * metrics.height() + metrics.ascent()
+
+            painter.setPen(offset_color)
+            painter.drawText(4, y, f"{offset:0{self.offset_digits}x}")
+            painter.setPen(text_color)
+            painter.drawText(4 + offset_width, y, f"{hex_column:<{self.BYTES_PER_ROW * 3 + 1}} {data.translate(self.PRINTABLE).decode('ascii')}")
@@ -0,0 +1,251 @@
+from PyQt5.QtWidgets import QWidget, QHBoxLayout, QLabel, QProgressBar, QPushButton
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from collections import deque
+import threading
+import errno
+import time
+import os
+
+import workspace
+
+VERBS = {"delete": "Deleting", "create_file": "Creating", "create_folder": "Creating", "move": "Moving", "copy": "Copying", "rename": "Renaming"}
+
+
+class Cancelled(Exception):
+    pass
+
+
+class FileOperation:
+    """ One delete, create, move, copy or rename waiting in or running on the queue """
+
+    def __init__(self, kind, source, destination=None):
+        self.kind = kind
+        self.source = source
+        self.destination = destination  # Full target path for move, copy and rename
+        self.trash = None  # Where a delete was renamed to, before it is removed in the background
+        self.cancelled = False
+
+    def description(self):
+        return f"{VERBS[self.kind]} {os.path.basename(self.source)}"
+
+
+def trash_path(path):
+    """ A hidden sibling of path to rename it to. Being on the same file system, the rename is instant """
+    directory, name = os.path.split(os.path.normpath(path))
+    return os.path.join(directory, f".{name}{workspace.TRASH_MARKER}{os.urandom(4).hex()}")
+
+
+class FileOperationQueue(QThread):
+    """ Runs file operations one at a time on a background thread, in the order they were submitted.
+
+    Deletes are renamed to a hidden trash entry right away when nothing queued could depend on the
+    old path, so the tree updates at once while the actual removal carries on in the background.
+    """
+
+    operation_started = pyqtSignal(object)
+    progress = pyqtSignal(object, int, int)  # Operation, items done, total items (0 when unknown)
+    operation_finished = pyqtSignal(object, str)  # Operation, error message ("" when it succeeded)
+
+    PROGRESS_INTERVAL = 0.1  # Seconds between progress signals
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.current = None
+        self.stopping = False
+        self.last_progress = 0.0
+
+    def submit(self, operation, use_trash=True):
+        with self.condition:
+            # Later operations on the path would miss it once renamed, so only jump ahead when idle
+            if operation.kind == "delete" and use_trash and self.current is None and not self.pending:
+                trash = trash_path(operation.source)
+                try:
+                    os.rename(operation.source, trash)
+                    operation.trash = trash
+                except OSError:
+                    pass  # Deleted in place by the worker instead
+            self.pending.append(operation)
+            self.condition.notify()
+
+    def is_busy(self):
+        with self.condition:
+            return self.current is not None or bool(self.pending)
+
+    def cancel_all(self):
+        """ Drops the queued operations and stops the running one at its next file """
+        with self.condition:
+            for operation in self.pending:
+                operation.cancelled = True
+                self.restore_trash(operation)
+            self.pending.clear()
+            if self.current is not None:
+                self.current.cancelled = True
+
+    def stop(self):
+        """ Cancels everything and waits for the thread to exit, returns the trash entries it didn't get to remove """
+        with self.condition:
+            abandoned = list(self.pending) + ([self.current] if self.current is not None else [])
+            for operation in abandoned:
+                operation.cancelled = True
+            self.pending.clear()
+            self.stopping = True
+            self.condition.notify()
+        self.wait()
+        return [operation.trash for operation in abandoned if operation.trash is not None and os.path.lexists(operation.trash)]
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopping:
+                    self.condition.wait()
+                if self.stopping:
+                    return
+                operation = self.current = self.pending.popleft()
+
+            self.operation_started.emit(operation)
+            message = ""
+            try:
+                self.perform(operation)
+            except Cancelled:
+                if not self.stopping:  # Exiting leaves the trash to be removed next time
+                    self.restore_trash(operation)
+                message = "Cancelled"
+            except OSError as e:
+                message = str(e)
+
+            with self.condition:
+                self.current = None
+            self.operation_finished.emit(operation, message)
+
+    def perform(self, operation):
+        if operation.kind == "delete":
+            self.remove(operation, operation.trash or operation.source)
+        elif operation.kind == "create_file":
+            with open(operation.source, "x"):
+                pass  # Fails if something already has the name
+        elif operation.kind == "create_folder":
+            os.mkdir(operation.source)
+        elif operation.kind == "copy":
+            self.copy(operation)
+        else:  # move and rename
+            if os.path.exists(operation.destination):
+                raise FileExistsError(errno.EEXIST, "Already exists", operation.destination)
+            try:
+                os.rename(operation.source, operation.destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Another file system, so copy it over and remove the original
+                self.copy(operation)
+                self.remove(operation, operation.source)
+
+    def remove(self, operation, path):
+        if not os.path.isdir(path) or os.path.islink(path):
+            os.remove(path)
+            return
+
+        removed = 0
+        for directory, folders, files in os.walk(path, topdown=False):
+            for name in files + [folder for folder in folders if os.path.islink(os.path.join(directory, folder))]:
+                self.check(operation, removed, 0)
+                os.remove(os.path.join(directory, name))
+                removed += 1
+            for name in folders:
+                folder = os.path.join(directory, name)
+                if not os.path.islink(folder):
+                    os.rmdir(folder)
+        os.rmdir(path)
+
+    def copy(self, operation):
+        source, destination = operation.source, operation.destination
+        if os.path.exists(destination):
+            raise FileExistsError(errno.EEXIST, "Already exists", destination)
+        import shutil  # Only needed for copies, so it isn't loaded at startup
+
+        if not os.path.isdir(source):
+            shutil.copy2(source, destination)
+            return
+
+        total = sum(len(files) for _, _, files in os.walk(source))
+        copied = 0
+
+        def copy_file(file_source, file_destination):
+            nonlocal copied
+            self.check(operation, copied, total)
+            copied += 1
+            return shutil.copy2(file_source, file_destination)
+
+        try:
+            # copytree collects OSErrors from the copy function, but Cancelled stops it right away
+            shutil.copytree(source, destination, symlinks=True, copy_function=copy_file)
+        except Cancelled:
+            shutil.rmtree(destination, ignore_errors=True)  # Don't leave half a copy behind
+            raise
+
+    def check(self, operation, done, total):
+        """ Raises Cancelled once the operation is cancelled, and reports progress now and then """
+        if operation.cancelled:
+            raise Cancelled()
+        now = time.monotonic()
+        if now - self.last_progress >= self.PROGRESS_INTERVAL:
+            self.last_progress = now
+            self.progress.emit(operation, done, total)
+
+    def restore_trash(self, operation):
+        """ Puts what is left of a cancelled delete back under its name, when that is still free """
+        if operation.trash is not None and os.path.lexists(operation.trash) and not os.path.lexists(operation.source):
+            try:
+                os.rename(operation.trash, operation.source)
+                operation.trash = None
+            except OSError:
+                pass
+
+
+class OperationStatus(QWidget):
+    """ Progress of the file operation queue, hidden while it is idle """
+
+    def __init__(self, queue, parent=None):
+        super().__init__(parent)
+        self.queue = queue
+
+        self.label = QLabel()
+        self.progress_bar = QProgressBar()
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(queue.cancel_all)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.label)
+        layout.addWidget(self.progress_bar, 1)
+        layout.addWidget(self.cancel_button)
+        self.hide()
+
+        # Quick operations finish before the bar would be noticed, so only show it for slow ones
+        self.show_timer = QTimer(self)
+        self.show_timer.setSingleShot(True)
+        self.show_timer.setInterval(300)
+        self.show_timer.timeout.connect(self.show)
+
+        queue.operation_started.connect(self.operation_started)
+        queue.progress.connect(self.show_progress)
+        queue.operation_finished.connect(self.operation_finished)
+
+    def operation_started(self, operation):
+        self.label.setText(operation.description())
+        self.progress_bar.setRange(0, 0)  # Busy until the first progress report
+        if not self.isVisible():
+            self.show_timer.start()
+
+    def show_progress(self, operation, done, total):
+        if total:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(done)
+        else:
+            self.label.setText(f"{operation.description()} ({done} items)")
+
+    def operation_finished(self, operation, message):
+        if not self.queue.is_busy():
+            self.show_timer.stop()
+            self.hide()
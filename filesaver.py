@@ -0,0 +1,239 @@
+from PyQt5.QtCore import QObject, QThread, pyqtSignal
+import collections
+import threading
+import tempfile
+import os
+
+import longlines
+
+# Permissions a newly created file would get, read once while the app is still single-threaded
+_umask = os.umask(0)
+os.umask(_umask)
+NEW_FILE_MODE = 0o666 & ~_umask
+
+
+def write_atomic(path, text, encoding="utf-8"):
+    """ Writes text to a temp file next to path, fsyncs it and renames it over path.
+
+    A crash part way through leaves the original file untouched instead of truncated.
+    """
+    path = os.path.realpath(path)  # Replace a symlink's target, not the link
+    directory = os.path.dirname(path)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding=encoding) as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+
+        # mkstemp creates the file private to the user, keep the original's permissions instead
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(temp_path, NEW_FILE_MODE)
+
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+    # Make the rename itself durable, only possible on POSIX
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class FileWriter(QThread):
+    """ Background thread that writes snapshots to disk one at a time """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)  # Path, error message
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.condition = threading.Condition()
+        self.pending = None  # (path, text, encoding) waiting to be written
+        self.last_write = None  # (path, error message or None) of the last write done
+        self.stopping = False
+
+    def write(self, path, text, encoding="utf-8"):
+        with self.condition:
+            self.pending = (path, text, encoding)
+            self.condition.notify()
+
+    def stop(self):
+        """ Lets the thread finish the write it has and exit """
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopping:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                path, text, encoding = self.pending
+                self.pending = None
+
+            try:
+                write_atomic(path, text, encoding)
+            except (OSError, UnicodeEncodeError) as e:  # The text may have characters its file's encoding can't hold
+                self.last_write = (path, str(e))
+                self.failed.emit(path, str(e))
+            else:
+                self.last_write = (path, None)
+                self.saved.emit(path)
+
+
+class DocumentSaver(QObject):
+    """ Saves QTextDocuments without blocking the GUI.
+
+    Only one write is in flight at a time. Saves requested meanwhile are queued, those of the same document
+    to the same path merged into a single write of the latest text, and written in turn once it finishes.
+    Documents with no changes since their last save are skipped.
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)  # Path, error message
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.in_flight = None  # (document of the snapshot being written, whether it was edited since)
+        # (document, path) -> (document, path, force, encoding) to save once the write in flight is done.
+        # A snapshot taken of a document about to go is keyed (None, path) and holds its text instead of force
+        self.queued = collections.OrderedDict()
+        self.closing = False  # Once set, close writes what is queued itself
+
+        self.writer = FileWriter(self)
+        self.writer.saved.connect(self.write_finished)
+        self.writer.failed.connect(self.write_failed)
+        self.writer.start()
+
+    def save(self, document, path, force=False, encoding="utf-8"):
+        """ Saves document to path, force writes it even if it is unmodified (e.g. to a new path) """
+        if self.in_flight is not None:
+            merged = self.queued.get((document, path))
+            if merged is not None:
+                force = force or merged[2]
+            self.queued[(document, path)] = (document, path, force, encoding)
+            return
+
+        if not force and not document.isModified():
+            return  # Nothing changed since the last save
+
+        # plain_text is the one copy made on the GUI thread, the writer only ever sees this snapshot.
+        # Edits are watched through contentsChange, revision() also moves when a highlighter reformats
+        self.in_flight = (document, False)
+        document.contentsChange.connect(self.in_flight_edited)
+        self.writer.write(path, longlines.plain_text(document), encoding)
+
+    def in_flight_edited(self):
+        self.in_flight = (self.in_flight[0], True)
+
+    def end_in_flight(self):
+        """ Stops watching the document being written, returns (document, whether it was edited since) """
+        document, edited = self.in_flight
+        self.in_flight = None
+        if document is not None:
+            document.contentsChange.disconnect(self.in_flight_edited)
+        return document, edited
+
+    def save_text(self, path, text, encoding="utf-8"):
+        """ Saves a snapshot taken earlier, tied to no document """
+        self.in_flight = (None, False)
+        self.writer.write(path, text, encoding)
+
+    def snapshot_queued(self, document=None):
+        """ Takes the text of the queued saves of document (of every document if None) now, so they no longer depend on it """
+        queued = collections.OrderedDict()
+        for key, save in self.queued.items():
+            queued_document, path, force, encoding = save
+            if queued_document is None or (document is not None and queued_document is not document):
+                queued[key] = save
+            elif force or queued_document.isModified():
+                queued[(None, path)] = (None, path, longlines.plain_text(queued_document), encoding)
+        self.queued = queued
+
+    def uses(self, document):
+        """ Whether a save in flight or queued after it still refers to document """
+        return (self.in_flight is not None and self.in_flight[0] is document) or any(key[0] is document for key in self.queued)
+
+    def release(self, document):
+        """ Lets go of a document about to be deleted, its queued saves take its text now """
+        self.snapshot_queued(document)
+        if self.in_flight is not None and self.in_flight[0] is document:
+            self.end_in_flight()
+            self.in_flight = (None, False)  # Still written, just not marked saved
+
+    def is_saving(self):
+        return self.in_flight is not None or bool(self.queued)
+
+    def write_finished(self, path):
+        if self.in_flight is None:
+            return  # Already handled by close
+        document, edited = self.end_in_flight()
+
+        # Edits made while writing still need saving
+        if document is not None and not edited:
+            document.setModified(False)
+        self.saved.emit(path)
+        self.save_queued()
+
+    def write_failed(self, path, message):
+        if self.in_flight is None:
+            return
+        self.end_in_flight()
+        self.failed.emit(path, message)
+        self.save_queued()
+
+    def save_queued(self):
+        # Until one of them starts a write, a save of an unmodified document doesn't
+        while self.queued and self.in_flight is None and not self.closing:
+            _, (document, path, force_or_text, encoding) = self.queued.popitem(last=False)
+            if document is None:
+                self.save_text(path, force_or_text, encoding)
+            else:
+                self.save(document, path, force_or_text, encoding)
+
+    def close(self):
+        """ Finishes the write in flight and the saves queued after it, blocking until they are on disk.
+
+        Documents written are marked saved as usual, so their journals know there is nothing left to recover.
+        """
+        self.closing = True
+        self.writer.stop()
+        self.writer.wait()
+
+        # The signal of the write in flight would only arrive after the window is gone
+        if self.in_flight is not None and self.writer.last_write is not None:
+            path, message = self.writer.last_write
+            if message is None:
+                self.write_finished(path)
+            else:
+                self.write_failed(path, message)
+
+        while self.queued:
+            _, (document, path, force_or_text, encoding) = self.queued.popitem(last=False)
+            if document is None:
+                text = force_or_text
+            elif force_or_text or document.isModified():
+                text = longlines.plain_text(document)
+            else:
+                continue
+            try:
+                write_atomic(path, text, encoding)
+            except (OSError, UnicodeEncodeError) as e:
+                self.failed.emit(path, str(e))
+                continue
+            if document is not None:
+                document.setModified(False)
+            self.saved.emit(path)
@@ -1,122 +1,436 @@
 from PyQt5.QtGui import QColor, QFont, QSyntaxHighlighter, QTextCharFormat
-from PyQt5.QtCore import QRegularExpression
+from PyQt5.QtCore import QObject, QTimer
 import keyword
 import builtins
+import time
+import os
+import re
 
-class PythonHighlighter(QSyntaxHighlighter):
-    def __init__(self, document):
-        super().__init__(document)
+import longlines
+
+# Block states, carried from one block to the next so strings and comments can span lines.
+# States above NORMAL are defined by each lexer.
+UNHIGHLIGHTED = -1  # Qt's initial userState(), so it marks blocks never highlighted
+NORMAL = 0
+
+MAX_HIGHLIGHT_CHARS = 10000  # Longer blocks aren't tokenized, it would stall every keystroke
+
+
+def text_format(color, bold=False, italic=False):
+    text_format = QTextCharFormat()
+    text_format.setForeground(QColor(color))
+    if bold:
+        text_format.setFontWeight(QFont.Bold)
+    if italic:
+        text_format.setFontItalic(True)
+    return text_format
 
+
+class Lexer:
+    """ The compiled rules and formats of one language, built once and shared by all its highlighters.
+
+    token_pattern is a single regex with one named group per kind of token, so a block is scanned once
+    from left to right. Identifiers (an identifier group with name and follow subgroups) are classified
+    by name_format. Tokens that can run on into the next block set a state through open_state, and
+    continuations maps that state to a regex (with a close group) that finishes the token on a later block.
+    """
+
+    name = ""
+    extensions = ()
+    token_pattern = None
+    continuations = {}
+    multiline_kinds = frozenset()  # Token kinds open_state has to look at
+
+    def __init__(self):
         # One Dark Theme Colors
-        self.keyword_format = QTextCharFormat()
-        self.keyword_format.setForeground(QColor("#c678dd"))  # Purple for keywords
-        self.keyword_format.setFontWeight(QFont.Bold)
+        self.keyword_format = text_format("#c678dd", bold=True)  # Purple for keywords
+        self.comment_format = text_format("#5c6370", italic=True)  # Grey for comments
+        self.string_format = text_format("#98c379")  # Green for strings
+        self.number_format = text_format("#d19a66")  # Orange for numbers
+        self.variable_format = text_format("#e5c07b")  # Yellow for variables
+        self.function_format = text_format("#61afef")  # Blue for functions
+        self.builtin_format = text_format("#56b6c2")  # Cyan for built-in functions
+        self.self_format = text_format("#e06c75")  # Light Red for 'self'
+
+        self.formats = {}  # Token kind -> format
+        self.state_formats = {}  # Continuation state -> format of the text it covers
 
-        self.comment_format = QTextCharFormat()
-        self.comment_format.setForeground(QColor("#5c6370"))  # Grey for comments
-        self.comment_format.setFontItalic(True)
+    def name_format(self, name, previous_name, follow):
+        """ Picks the format for an identifier, or None to leave it unformatted """
+        return None
 
-        self.string_format = QTextCharFormat()
-        self.string_format.setForeground(QColor("#98c379"))  # Green for strings
+    def open_state(self, match):
+        """ Returns the state a multi-line token leaves the block in, NORMAL if it ended on this line """
+        return NORMAL
 
-        self.number_format = QTextCharFormat()
-        self.number_format.setForeground(QColor("#d19a66"))  # Orange for numbers
 
-        self.variable_format = QTextCharFormat()
-        self.variable_format.setForeground(QColor("#e5c07b"))  # Yellow for variables
+class PythonLexer(Lexer):
+    name = "Python"
+    extensions = (".py", ".pyw", ".pyi")
 
-        self.function_format = QTextCharFormat()
-        self.function_format.setForeground(QColor("#61afef"))  # Blue for functions
+    IN_SINGLE_TRIPLE = 1  # inside a ''' string
+    IN_DOUBLE_TRIPLE = 2  # inside a """ string
+    TRIPLE_STATES = {"'''": IN_SINGLE_TRIPLE, '"""': IN_DOUBLE_TRIPLE}
 
-        self.builtin_format = QTextCharFormat()
-        self.builtin_format.setForeground(QColor("#56b6c2"))  # Cyan for built-in functions
+    token_pattern = re.compile(r"""
+        (?P<comment>\#.*)
+      | (?P<triple>(?:[rRbBuUfF]{1,2})?(?P<delim>'''|\"\"\")(?:[^\\]|\\.?)*?(?P<close>(?P=delim)|$))
+      | (?P<string>(?:[rRbBuUfF]{1,2})?(?:"(?:[^"\\]|\\.?)*(?:"|$)|'(?:[^'\\]|\\.?)*(?:'|$)))
+      | (?P<number>\b(?:0[xX][0-9A-Fa-f]+|0[bB][01]+|\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)\b)
+      | (?P<identifier>(?P<name>[^\W\d]\w*)(?=(?:\s*(?P<follow>\(|=(?!=)))?))
+    """, re.VERBOSE)
 
-        self.self_format = QTextCharFormat()
-        self.self_format.setForeground(QColor("#e06c75"))  # Light Red for 'self'
+    # Closing delimiter of a triple-quoted string that is still open, honoring escapes
+    continuations = {
+        IN_SINGLE_TRIPLE: re.compile(r"(?:[^\\]|\\.?)*?(?P<close>'''|$)"),
+        IN_DOUBLE_TRIPLE: re.compile(r'(?:[^\\]|\\.?)*?(?P<close>"""|$)'),
+    }
+    multiline_kinds = frozenset({"triple"})
 
-        # Define regex patterns
+    def __init__(self):
+        super().__init__()
+        self.formats = {"comment": self.comment_format, "triple": self.string_format, "string": self.string_format, "number": self.number_format}
+        self.state_formats = {self.IN_SINGLE_TRIPLE: self.string_format, self.IN_DOUBLE_TRIPLE: self.string_format}
+
+        # Identifiers are classified with set lookups instead of one regex per word list
         self.keywords = set(keyword.kwlist)
         self.builtins = set(dir(builtins))  # Get built-in functions
 
-        self.keyword_pattern = QRegularExpression(r"\b(" + "|".join(self.keywords) + r")\b")
-        self.comment_pattern = QRegularExpression(r"#.*")  # Single-line comments
-        self.string_pattern = QRegularExpression(r"\"\"\".*?\"\"\"|'''(.*?)'''|\"[^\"]*\"|'[^']*'")  # Multi & single-line strings
-        self.number_pattern = QRegularExpression(r"\b\d+(\.\d+)?([eE][-+]?\d+)?\b|\b0x[0-9A-Fa-f]+\b|\b0b[01]+\b")  # Decimal, hex, binary
+    def name_format(self, name, previous_name, follow):
+        if name == "self":
+            return self.self_format
+        if name in self.builtins:
+            return self.builtin_format
+        if name in self.keywords:
+            return self.keyword_format
+        if previous_name == "def":
+            return self.function_format
+        if follow:  # Called (name(...)) or assigned (name = ...)
+            return self.variable_format
+        return None
+
+    def open_state(self, match):
+        # Unterminated on this line, so the string continues into the next block
+        return NORMAL if match.group("close") else self.TRIPLE_STATES[match.group("delim")]
+
+
+class JavaScriptLexer(Lexer):
+    name = "JavaScript"
+    extensions = (".js", ".mjs", ".cjs", ".jsx")
+
+    IN_BLOCK_COMMENT = 1
+    IN_TEMPLATE = 2
+
+    token_pattern = re.compile(r"""
+        (?P<comment>//.*)
+      | (?P<block_comment>/\*.*?(?P<comment_close>\*/|$))
+      | (?P<template>`(?:[^`\\]|\\.?)*(?P<template_close>`|$))
+      | (?P<string>"(?:[^"\\]|\\.?)*(?:"|$)|'(?:[^'\\]|\\.?)*(?:'|$))
+      | (?P<number>\b(?:0[xX][0-9A-Fa-f]+|0[bB][01]+|0[oO][0-7]+|\d+(?:\.\d+)?(?:[eE][-+]?\d+)?n?)\b)
+      | (?P<identifier>(?P<name>[A-Za-z_$][\w$]*)(?=(?:\s*(?P<follow>\(|=(?![=>])))?))
+    """, re.VERBOSE)
+
+    continuations = {
+        IN_BLOCK_COMMENT: re.compile(r".*?(?P<close>\*/|$)"),
+        IN_TEMPLATE: re.compile(r"(?:[^`\\]|\\.?)*?(?P<close>`|$)"),
+    }
+    multiline_kinds = frozenset({"block_comment", "template"})
+
+    def __init__(self):
+        super().__init__()
+        self.formats = {"comment": self.comment_format, "block_comment": self.comment_format,
+                        "template": self.string_format, "string": self.string_format, "number": self.number_format}
+        self.state_formats = {self.IN_BLOCK_COMMENT: self.comment_format, self.IN_TEMPLATE: self.string_format}
+
+        self.keywords = {
+            "async", "await", "break", "case", "catch", "class", "const", "continue", "debugger", "default", "delete",
+            "do", "else", "export", "extends", "false", "finally", "for", "from", "function", "if", "import", "in",
+            "instanceof", "let", "new", "null", "of", "return", "static", "super", "switch", "throw", "true", "try",
+            "typeof", "undefined", "var", "void", "while", "with", "yield",
+        }
+        self.builtins = {
+            "Array", "BigInt", "Boolean", "console", "Date", "document", "Error", "globalThis", "JSON", "Map", "Math",
+            "Number", "Object", "Promise", "Proxy", "Reflect", "RegExp", "require", "module", "Set", "String",
+            "Symbol", "WeakMap", "WeakSet", "window", "parseInt", "parseFloat", "isNaN", "setTimeout", "setInterval",
+        }
+
+    def name_format(self, name, previous_name, follow):
+        if name == "this":
+            return self.self_format
+        if name in self.keywords:
+            return self.keyword_format
+        if name in self.builtins:
+            return self.builtin_format
+        if previous_name in ("function", "class"):
+            return self.function_format
+        if follow:
+            return self.variable_format
+        return None
+
+    def open_state(self, match):
+        if match.lastgroup == "block_comment":
+            return NORMAL if match.group("comment_close") else self.IN_BLOCK_COMMENT
+        return NORMAL if match.group("template_close") else self.IN_TEMPLATE
+
+
+class JsonLexer(Lexer):
+    name = "JSON"
+    extensions = (".json",)
+
+    token_pattern = re.compile(r"""
+        (?P<key>"(?:[^"\\]|\\.)*"(?=\s*:))
+      | (?P<string>"(?:[^"\\]|\\.?)*(?:"|$))
+      | (?P<number>-?\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b)
+      | (?P<literal>\b(?:true|false|null)\b)
+    """, re.VERBOSE)
+
+    def __init__(self):
+        super().__init__()
+        self.formats = {"key": self.self_format, "string": self.string_format, "number": self.number_format, "literal": self.keyword_format}
+
+
+class MarkdownLexer(Lexer):
+    name = "Markdown"
+    extensions = (".md", ".markdown")
+
+    IN_FENCE = 1  # inside a ``` code block
+
+    # Block-level markup is anchored to the start of the block, inline markup can be anywhere
+    token_pattern = re.compile(r"""
+        (?P<fence>^\s*(?:```|~~~).*)
+      | (?P<heading>^\#{1,6}(?:\s.*|$))
+      | (?P<quote>^\s*>.*)
+      | (?P<list_marker>^\s*(?:[-*+]|\d+[.)])(?=\s))
+      | (?P<code>`[^`]*`)
+      | (?P<strong>\*\*[^*]+\*\*|(?<!\w)__[^_]+__(?!\w))
+      | (?P<emphasis>\*[^*\s][^*]*\*|(?<!\w)_[^_\s][^_]*_(?!\w))
+      | (?P<link>!?\[[^\]]*\]\([^)]*\))
+    """, re.VERBOSE)
+
+    continuations = {
+        IN_FENCE: re.compile(r"(?:\s*(?P<close>```|~~~).*|.*)"),
+    }
+    multiline_kinds = frozenset({"fence"})
+
+    def __init__(self):
+        super().__init__()
+        self.formats = {
+            "fence": self.string_format,
+            "heading": self.keyword_format,
+            "quote": self.comment_format,
+            "list_marker": self.number_format,
+            "code": self.string_format,
+            "strong": text_format("#e5c07b", bold=True),
+            "emphasis": text_format("#e5c07b", italic=True),
+            "link": self.function_format,
+        }
+        self.state_formats = {self.IN_FENCE: self.string_format}
+
+    def open_state(self, match):
+        return self.IN_FENCE  # A fence line always opens a code block, a later fence line closes it
+
+
+# Lexer classes by file extension, each instantiated once on first use and then shared
+LEXERS = {}
+_shared_lexers = {}
+
+
+def register_lexer(lexer_class):
+    for extension in lexer_class.extensions:
+        LEXERS[extension] = lexer_class
+
+
+def shared_lexer(lexer_class):
+    """ Returns the one instance of lexer_class, compiling it on first use """
+    lexer = _shared_lexers.get(lexer_class)
+    if lexer is None:
+        lexer = _shared_lexers[lexer_class] = lexer_class()
+    return lexer
+
 
-        self.variable_pattern = QRegularExpression(r"\b(?!\d)(\w+)\b(?=\s*=\s*[^=])")  # Variable assignment regex
-        self.function_pattern = QRegularExpression(r"\bdef\s+(\w+)\b")  # Function definition regex
-        self.builtin_pattern = QRegularExpression(r"\b(" + "|".join(self.builtins) + r")\b")  # Built-in functions regex
-        self.variable_usage_pattern = QRegularExpression(r"\b(?!\d)(\w+)\b(?=\s*\()")  # Variable usage regex (e.g., var.func())
-        self.self_pattern = QRegularExpression(r"\bself\b")  # 'self' keyword regex
+def lexer_for_path(path):
+    """ Returns the shared lexer for a file, or None if its language isn't known """
+    lexer_class = LEXERS.get(os.path.splitext(path)[1].lower())
+    return shared_lexer(lexer_class) if lexer_class is not None else None
+
+
+register_lexer(PythonLexer)
+register_lexer(JavaScriptLexer)
+register_lexer(JsonLexer)
+register_lexer(MarkdownLexer)
+
+
+class Highlighter(QSyntaxHighlighter):
+    def __init__(self, document, lexer, lazy=False):
+        super().__init__(document)
+        self.lexer = lexer
+
+        # A lazy highlighter leaves unhighlighted blocks alone unless they are in allowed_blocks,
+        # so attaching it to a large document doesn't highlight the whole file up front
+        self.lazy = lazy
+        self.allowed_blocks = range(0)
 
     def highlightBlock(self, text):
-        """ Applies syntax highlighting to the given block of text """
-
-        # 1. Highlight Comments (first to prevent other highlights)
-        comment_match = self.comment_pattern.match(text)
-        if comment_match.hasMatch():
-            self.setFormat(comment_match.capturedStart(), comment_match.capturedLength(), self.comment_format)
-            return  # Skip processing other patterns in comment lines
-
-        # 2. Highlight Strings (before everything else, so nothing inside strings gets highlighted)
-        string_ranges = []
-        string_match = self.string_pattern.globalMatch(text)
-        while string_match.hasNext():
-            match = string_match.next()
-            self.setFormat(match.capturedStart(), match.capturedLength(), self.string_format)
-            string_ranges.append((match.capturedStart(), match.capturedEnd()))  # Store string positions
-
-        def is_inside_string(position):
-            """ Helper function to check if a position is inside a string """
-            return any(start <= position < end for start, end in string_ranges)
-
-        # 3. Highlight Keywords (ONLY if they are not inside a string)
-        keyword_match = self.keyword_pattern.globalMatch(text)
-        while keyword_match.hasNext():
-            match = keyword_match.next()
-            if not is_inside_string(match.capturedStart()):
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.keyword_format)
-
-        # 4. Highlight Numbers (ONLY if they are not inside a string)
-        number_match = self.number_pattern.globalMatch(text)
-        while number_match.hasNext():
-            match = number_match.next()
-            if not is_inside_string(match.capturedStart()):
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.number_format)
-
-        # 5. Highlight Function Definitions (ONLY if not inside a string)
-        function_match = self.function_pattern.globalMatch(text)
-        while function_match.hasNext():
-            match = function_match.next()
-            if not is_inside_string(match.capturedStart()):
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.function_format)
-
-        # 6. Highlight Variables in Assignments (ONLY if not inside a string)
-        variable_match = self.variable_pattern.globalMatch(text)
-        while variable_match.hasNext():
-            match = variable_match.next()
-            variable_name = match.captured(1)
-            if not is_inside_string(match.capturedStart()) and variable_name not in self.keywords and variable_name not in self.builtins:
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.variable_format)
-
-        # 7. Highlight Built-in Functions (ONLY if not inside a string)
-        builtin_match = self.builtin_pattern.globalMatch(text)
-        while builtin_match.hasNext():
-            match = builtin_match.next()
-            if not is_inside_string(match.capturedStart()):
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.builtin_format)
-
-        # 8. Highlight Variable Usage in Function Calls (ONLY if not inside a string)
-        variable_usage_match = self.variable_usage_pattern.globalMatch(text)
-        while variable_usage_match.hasNext():
-            match = variable_usage_match.next()
-            variable_name = match.captured(1)
-            if not is_inside_string(match.capturedStart()) and variable_name not in self.keywords and variable_name not in self.builtins:
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.variable_format)
-
-        # 9. Highlight 'self' keyword in classes (ONLY if not inside a string)
-        self_match = self.self_pattern.globalMatch(text)
-        while self_match.hasNext():
-            match = self_match.next()
-            if not is_inside_string(match.capturedStart()):
-                self.setFormat(match.capturedStart(), match.capturedLength(), self.self_format)
+        """ Applies syntax highlighting to the given block of text in a single pass """
+        if self.lazy and self.currentBlockState() == UNHIGHLIGHTED \
+                and self.currentBlock().blockNumber() not in self.allowed_blocks:
+            return  # Left for LazyHighlighting; the unchanged state also stops Qt's cascade here
+
+        lexer = self.lexer
+        state = self.previousBlockState()
+        position = 0
+
+        # 1. Finish a string or comment left open by a previous block
+        continuation = lexer.continuations.get(state)
+        if continuation is not None:
+            match = continuation.match(text)
+            end = match.end()
+            self.setFormat(0, end, lexer.state_formats[state])
+            if not match.group("close"):
+                self.setCurrentBlockState(state)
+                return
+            position = end
+
+        self.setCurrentBlockState(NORMAL)
+        if len(text) > MAX_HIGHLIGHT_CHARS or self.is_split_line():
+            return  # Left plain past the end of an open string, tokens cut by a soft break would throw the colours off
+
+        formats = lexer.formats
+        multiline_kinds = lexer.multiline_kinds
+        previous_name = None
+
+        # 2. Tokenize the rest of the block; strings and comments swallow everything inside them
+        for match in lexer.token_pattern.finditer(text, position):
+            kind = match.lastgroup
+            start = match.start()
+            length = match.end() - start
+
+            if kind == "identifier":
+                name = match.group("name")
+                name_format = lexer.name_format(name, previous_name, match.group("follow"))
+                if name_format is not None:
+                    self.setFormat(start, length, name_format)
+                previous_name = name
+                continue
+
+            previous_name = None
+            self.setFormat(start, length, formats[kind])
+            if kind in multiline_kinds:
+                state = lexer.open_state(match)
+                if state != NORMAL:
+                    self.setCurrentBlockState(state)
+
+
+    def is_split_line(self):
+        """ Whether the current block is part of a long line split by soft breaks """
+        block = self.currentBlock()
+        following = block.next()
+        return longlines.is_continuation(block) or (following.isValid() and longlines.is_continuation(following))
+
+
+class PythonHighlighter(Highlighter):
+    def __init__(self, document, lazy=False):
+        super().__init__(document, shared_lexer(PythonLexer), lazy)
+
+
+class LazyHighlighting(QObject):
+    """ Highlights the visible blocks of an editor right away and the rest of the document while idle """
+
+    CHUNK_SECONDS = 0.005  # Time box for one idle chunk, short enough not to delay keystrokes
+    BATCH_BLOCKS = 64  # Blocks highlighted per rehighlightBlock call within a chunk
+    LOOKAHEAD_BLOCKS = 20  # Blocks below the viewport treated as visible, for smooth scrolling
+
+    def __init__(self, highlighter, editor):
+        super().__init__(highlighter)
+        self.highlighter = highlighter
+        self.editor = editor
+        self.next_block = 0  # Everything above this block has been highlighted
+        self.busy = False  # Highlighting repaints the viewport, which would re-enter through updateRequest
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(0)  # Fires whenever the event loop has nothing else to do
+        self.timer.timeout.connect(self.highlight_chunk)
+
+        # Scrolling and resizing bring new blocks into view, edits may leave unhighlighted blocks behind
+        editor.updateRequest.connect(self.highlight_visible)
+        highlighter.document().contentsChange.connect(self.document_changed)
+
+        QTimer.singleShot(0, self.highlight_visible)
+
+    def visible_range(self):
+        """ Returns the range of block numbers currently in (or just below) the viewport """
+        block = self.editor.firstVisibleBlock()
+        first = block.blockNumber()
+        offset = self.editor.contentOffset()
+        height = self.editor.viewport().height()
+
+        last = first
+        while block.isValid() and self.editor.blockBoundingGeometry(block).translated(offset).top() <= height:
+            last = block.blockNumber()
+            block = block.next()
+        return range(first, last + 1 + self.LOOKAHEAD_BLOCKS)
+
+    def highlight_visible(self):
+        """ Highlights whatever is in view now, then lets the idle queue carry on """
+        document = self.highlighter.document()
+        if document is None or self.busy or self.editor.document() is not document:
+            return  # Detached, or the editor is showing another document
+
+        visible = self.visible_range()
+        self.highlighter.allowed_blocks = visible
+        self.highlight_blocks(document.findBlockByNumber(visible.start), visible.stop - 1)
+
+        if self.next_block < document.blockCount():
+            self.timer.start()
+
+    def highlight_chunk(self):
+        """ Highlights blocks from the top of the queue until the time box runs out """
+        document = self.highlighter.document()
+        if document is None:
+            self.timer.stop()
+            return
+
+        deadline = time.perf_counter() + self.CHUNK_SECONDS
+        block = self.highlight_blocks(document.findBlockByNumber(self.next_block), document.blockCount(), deadline)
+
+        if block.isValid():
+            self.next_block = block.blockNumber()
+        else:
+            self.next_block = document.blockCount()
+            self.timer.stop()
+
+    def highlight_blocks(self, block, last_block, deadline=None):
+        """ Highlights the unhighlighted blocks from block through last_block, or until the deadline,
+        and returns the first block left for later """
+        document = self.highlighter.document()
+        visible = self.highlighter.allowed_blocks
+        self.busy = True
+
+        while block.isValid() and block.blockNumber() <= last_block:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+
+            if block.userState() == UNHIGHLIGHTED:
+                # Qt carries on to the next block while states change, which covers the whole batch and
+                # also fixes blocks that were highlighted out of order with the wrong starting state
+                number = block.blockNumber()
+                self.highlighter.allowed_blocks = range(number, min(number + self.BATCH_BLOCKS, last_block + 1))
+                self.highlighter.rehighlightBlock(block)
+                block = document.findBlockByNumber(self.highlighter.allowed_blocks.stop)
+            else:
+                block = block.next()
+
+        self.highlighter.allowed_blocks = visible
+        self.busy = False
+        return block
+
+    def document_changed(self, position, chars_removed, chars_added):
+        """ Requeues the edited area, since an edit outside the viewport leaves it unhighlighted """
+        document = self.highlighter.document()
+        if document is None:
+            return
+
+        number = document.findBlock(position).blockNumber()
+        if number < self.next_block:
+            self.next_block = number
+        self.timer.start()
@@ -0,0 +1,354 @@
+from PyQt5.QtCore import QObject, QTimer, QStandardPaths, QLockFile, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+import threading
+import hashlib
+import json
+import glob
+import os
+
+import documents
+import filesaver
+import longlines
+
+JOURNAL_VERSION = 2
+
+# In the journals' names next to the pid, which a new process can get again (always the same one in a container)
+SESSION_ID = os.urandom(4).hex()
+
+
+def journal_folder():
+    return os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), "qwerty", "journal")
+
+
+def read_text(path, encoding="utf-8"):
+    """ Reads a file the way FileReader does: decoded with replacements and universal newlines """
+    with open(path, encoding=encoding, errors="replace") as file:
+        return file.read()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_journal(log_path):
+    """ Deletes a journal's log and every snapshot written for it """
+    for path in [log_path, log_path + ".tmp"] + glob.glob(glob.escape(log_path[:-len(".log")]) + ".*.snapshot"):
+        remove_file(path)
+
+
+def write_snapshot(journal, path, text):
+    """ Writes a journal's snapshot on a thread of its own, so a big document doesn't hold up typing """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        filesaver.write_atomic(path, text)
+        written = True
+    except OSError:
+        written = False
+    try:
+        journal.snapshot_written.emit(path, written)
+    except RuntimeError:
+        remove_file(path)  # The journal was detached meanwhile, nothing refers to it
+
+
+def session_lock(pid):
+    lock = QLockFile(os.path.join(journal_folder(), f"session-{pid}.lock"))
+    lock.setStaleLockTime(0)  # Only stale once its process is gone, however long it has been running
+    return lock
+
+
+def lock_session():
+    """ Marks the journals of this process as in use for as long as the returned lock is held """
+    os.makedirs(journal_folder(), exist_ok=True)
+    lock = session_lock(os.getpid())
+    lock.tryLock(0)
+    return lock
+
+
+def session_running(pid):
+    """ Whether the editor that wrote a journal is still running, QLockFile knows a crashed one's lock is stale """
+    lock = session_lock(pid)
+    if lock.tryLock(0):
+        lock.unlock()
+        return False
+    return True
+
+
+class EditJournal(QObject):
+    """ Append-only log of the edits made to a document since it was last saved.
+
+    Each contentsChange is recorded as [position, characters removed, text inserted], so a keystroke
+    costs a few bytes no matter how big the file is. Records are buffered and appended once a second.
+    The log replays on top of its base: the file on disk as it was when the first edit was made, or a
+    snapshot of the whole document once the log has grown past the document's own size (so rewriting
+    the snapshot stays proportional to the edits that caused it). Saving the document discards the log.
+    The header records where the soft breaks of a document in long-line mode were in its base, so replay
+    lays the text out the same way. Snapshots are written on a thread of their own, the old log stays in
+    place until the new one is ready.
+    """
+
+    FLUSH_MS = 1000
+    MIN_COMPACT_BYTES = 1024 * 1024  # Log size below which it is never compacted
+
+    snapshot_written = pyqtSignal(str, bool)  # Path, whether it made it to disk
+
+    def __init__(self, document, path=None, encoding="utf-8", parent=None):
+        super().__init__(parent)
+        self.document = document
+        self.path = path  # None for an untitled document
+        self.encoding = encoding  # The file's, for reading the base back. Snapshots are always UTF-8
+
+        folder = journal_folder()
+        key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16] if path else f"untitled-{id(self):x}"
+        self.log_path = os.path.join(folder, f"{key}-{os.getpid()}-{SESSION_ID}.log")
+
+        self.base_stat = self.stat_file()  # (mtime, size) of the file the document matches, replayed on top of
+        self.base_soft_breaks = longlines.soft_break_offsets(document)  # Where that file's text was split
+        self.log = None  # Opened with the first edit
+        self.log_bytes = 0
+        self.pending = []  # Records not written yet
+        self.snapshot_name = None  # File name of the snapshot the log replays on top of, None for the file
+
+        # Compaction in progress: (snapshot file name, soft breaks) of the snapshot being written and
+        # the records flushed since it was taken, which start the log that replaces the current one
+        self.compacting = None
+        self.since_snapshot = []
+        self.snapshot_thread = None
+        self.generation = 0
+        self.snapshot_written.connect(self.snapshot_finished)
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
+        document.contentsChange.connect(self.record)
+        document.modificationChanged.connect(self.modification_changed)
+
+        # Already differs from the file (a recovered buffer), so the log starts from a snapshot
+        if document.isModified():
+            self.compact()
+
+    def record(self, position, chars_removed, chars_added):
+        record = [position, chars_removed, ""]
+        if chars_added:
+            cursor = QTextCursor(self.document)
+            cursor.setPosition(position)
+            cursor.setPosition(position + chars_added, QTextCursor.KeepAnchor)
+            text = cursor.selectedText()
+            record[2] = text.replace("\u2029", "\n")  # Qt's paragraph separator
+            if "\u2029" in text:
+                soft_breaks = longlines.soft_breaks_between(self.document, position, position + chars_added)
+                if soft_breaks:
+                    record.append(soft_breaks)  # Offsets of the newlines that are soft breaks
+        self.pending.append(json.dumps(record, ensure_ascii=False))
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def modification_changed(self, modified):
+        if not modified:
+            self.discard()  # Saved (or undone back to what is on disk), nothing left to recover
+            self.base_stat = self.stat_file()
+            self.base_soft_breaks = longlines.soft_break_offsets(self.document)
+
+    def file_saved(self):
+        """ The file was written, a document edited meanwhile is still modified but its log's base is gone """
+        self.base_stat = self.stat_file()
+        if self.document.isModified() and self.snapshot_name is None and self.compacting is None:
+            self.compact()
+
+    def stat_file(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except (OSError, TypeError):
+            return None, None
+
+    def header(self, snapshot=None, soft_breaks=()):
+        """ soft_breaks are block numbers in the snapshot, or without one offsets into the file's text """
+        base_mtime, base_size = (None, None) if snapshot else self.base_stat
+        return json.dumps({"version": JOURNAL_VERSION, "path": self.path, "pid": os.getpid(), "snapshot": snapshot,
+                           "encoding": self.encoding, "soft_breaks": list(soft_breaks if snapshot else self.base_soft_breaks),
+                           "base_mtime": base_mtime, "base_size": base_size})
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.log is None and self.compacting is not None:
+            self.since_snapshot.extend(self.pending)  # The file isn't the base any more, the snapshot will be
+            self.pending = []
+            return
+        try:
+            if self.log is None:
+                os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+                self.log = open(self.log_path, "w", encoding="utf-8")
+                self.log_bytes = self.log.write(self.header() + "\n")
+            self.log_bytes += self.log.write("\n".join(self.pending) + "\n")
+            self.log.flush()
+        except OSError:
+            return  # Keep the records and try again on the next edit
+        if self.compacting is not None:
+            self.since_snapshot.extend(self.pending)
+        self.pending = []
+
+        if self.compacting is None and self.log_bytes > max(self.MIN_COMPACT_BYTES, self.document.characterCount()):
+            self.compact()
+
+    def compact(self):
+        """ Starts replacing the log with a snapshot of the document and an empty log on top of it.
+
+        Only the copy of the text is made here, the snapshot is written by write_snapshot. It keeps soft
+        breaks as newlines, the header lists which ones they are.
+        """
+        self.flush_timer.stop()
+        self.pending = []
+        self.generation += 1
+        name = f"{os.path.basename(self.log_path)[:-len('.log')]}.{self.generation}.snapshot"
+        self.compacting = (name, longlines.soft_breaks(self.document))
+        self.since_snapshot = []
+        self.snapshot_thread = threading.Thread(target=write_snapshot, name="journal-snapshot", daemon=True,
+                                                args=(self, os.path.join(os.path.dirname(self.log_path), name), self.document.toPlainText()))
+        self.snapshot_thread.start()
+
+    def snapshot_finished(self, snapshot_path, written):
+        """ Puts a log of the edits made since the snapshot was taken in place of the old log """
+        name = os.path.basename(snapshot_path)
+        if self.compacting is None or self.compacting[0] != name:
+            if name != self.snapshot_name:
+                remove_file(snapshot_path)  # Discarded or superseded while it was being written
+            return
+
+        soft_breaks = self.compacting[1]
+        self.compacting = None
+        records, self.since_snapshot = self.since_snapshot, []
+        if not written:
+            return  # The next compaction tries again
+
+        # The new log is written in full before it replaces the old one, so a crash leaves one or the other
+        temp_path = self.log_path + ".tmp"
+        try:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+            with open(temp_path, "w", encoding="utf-8") as file:
+                self.log_bytes = file.write("\n".join([self.header(name, soft_breaks)] + records) + "\n")
+            os.replace(temp_path, self.log_path)
+            self.log = open(self.log_path, "a", encoding="utf-8")
+        except OSError:
+            remove_file(snapshot_path)
+            return
+
+        if self.snapshot_name is not None:
+            remove_file(os.path.join(os.path.dirname(self.log_path), self.snapshot_name))
+        self.snapshot_name = name
+
+    def close(self):
+        """ Writes out what is buffered and stops recording, leaving the log for recovery """
+        self.flush()
+        if self.compacting is not None:
+            self.snapshot_thread.join()  # Its signal would only arrive after this journal is gone
+            snapshot_path = os.path.join(os.path.dirname(self.log_path), self.compacting[0])
+            self.snapshot_finished(snapshot_path, os.path.exists(snapshot_path))
+        self.detach()
+
+    def discard(self):
+        """ Deletes the log and snapshots, recording starts over with the next edit """
+        self.flush_timer.stop()
+        self.pending = []
+        self.compacting = None  # A snapshot still being written is deleted once it is done
+        self.since_snapshot = []
+        self.snapshot_name = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        remove_journal(self.log_path)
+
+    def detach(self):
+        self.flush_timer.stop()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+        try:
+            self.document.contentsChange.disconnect(self.record)
+            self.document.modificationChanged.disconnect(self.modification_changed)
+        except (TypeError, RuntimeError):
+            pass  # The document is already gone
+        self.deleteLater()
+
+
+class RecoveredJournal:
+    """ A journal left behind by a session that didn't save its changes """
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        with open(log_path, encoding="utf-8") as file:
+            self.header = json.loads(file.readline())
+        snapshot = self.header.get("snapshot")
+        self.snapshot_path = os.path.join(os.path.dirname(log_path), snapshot) if isinstance(snapshot, str) else None
+        self.path = self.header.get("path")
+        self.pid = self.header.get("pid")
+        self.encoding = self.header.get("encoding", "utf-8")
+
+    def replay(self):
+        """ Returns the text of the document as it was last logged, raises ValueError if its base has changed """
+        if self.snapshot_path is not None:
+            # Laid out as it was rather than chunked again, the logged positions depend on it
+            document = documents.new_document()
+            document.setPlainText(read_text(self.snapshot_path))
+            longlines.mark_soft_breaks(document, self.header.get("soft_breaks", []))
+        elif self.path:
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                raise ValueError("the file it was based on is gone")
+            if (stat.st_mtime_ns, stat.st_size) != (self.header.get("base_mtime"), self.header.get("base_size")):
+                raise ValueError("the file has changed on disk since")
+            document = documents.new_document()
+            longlines.insert_split(QTextCursor(document), read_text(self.path, self.encoding), self.header.get("soft_breaks", []))
+        else:
+            document = documents.new_document()
+
+        # Positions are Qt's (UTF-16) positions, so replay into a document rather than a str
+        cursor = QTextCursor(document)
+        with open(self.log_path, encoding="utf-8") as file:
+            file.readline()
+            for line in file:
+                try:
+                    record = json.loads(line)
+                    position, chars_removed, text = record[:3]
+                except (ValueError, TypeError):
+                    break  # A record cut short by the crash
+                if position + chars_removed >= document.characterCount():
+                    break
+                cursor.setPosition(position)
+                cursor.setPosition(position + chars_removed, QTextCursor.KeepAnchor)
+                longlines.insert_text(cursor, text, record[3] if len(record) > 3 else ())
+
+        text = longlines.plain_text(document)
+        document.deleteLater()
+        return text
+
+    def discard(self):
+        remove_journal(self.log_path)
+
+
+def find_recoverable():
+    """ Returns the journals in the journal folder that no running editor owns """
+    try:
+        names = os.listdir(journal_folder())
+    except OSError:
+        return []
+
+    journals = []
+    for name in sorted(names):
+        if not name.endswith(".log") or name.endswith(f"-{SESSION_ID}.log"):
+            continue  # Not a journal, or one of ours
+        try:
+            journal = RecoveredJournal(os.path.join(journal_folder(), name))
+        except (OSError, ValueError):
+            continue
+        if journal.header.get("version") == JOURNAL_VERSION and not session_running(journal.pid):
+            journals.append(journal)
+    return journals
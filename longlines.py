@@ -0,0 +1,204 @@
+from PyQt5.QtCore import QObject
+from PyQt5.QtGui import QTextCursor, QTextBlockFormat, QTextCharFormat, QTextFormat
+import bisect
+
+# Lines longer than this are laid out as several blocks of at most this many characters. Qt lays out and
+# reshapes a whole block on every change to it, so a single block hundreds of KB long freezes the editor
+CHUNK_CHARS = 1024
+
+# Set on the character format of a soft break: a block separator that is only there to split a long line.
+# Block separators keep their format through undo and redo, user data set on the block wouldn't
+SOFT_BREAK_PROPERTY = QTextFormat.UserProperty + 1
+SOFT_BREAK_FORMAT = QTextCharFormat()
+SOFT_BREAK_FORMAT.setProperty(SOFT_BREAK_PROPERTY, True)
+PLAIN_FORMAT = QTextCharFormat()
+
+
+def has_long_line(text, column=0):
+    """ Whether text has a line longer than CHUNK_CHARS, its first line starting at column """
+    if column + len(text) <= CHUNK_CHARS:
+        return False
+    lines = text.split("\n")
+    return column + len(lines[0]) > CHUNK_CHARS or max(map(len, lines)) > CHUNK_CHARS
+
+
+def is_continuation(block):
+    """ Whether a block continues the line of the block before it """
+    return block.charFormat().boolProperty(SOFT_BREAK_PROPERTY)
+
+
+def line_map(document):
+    """ The LineMap of a document in long-line mode, None for any other document """
+    return document.findChild(LineMap)
+
+
+def enable(document):
+    if line_map(document) is None:
+        LineMap(document)
+
+
+def insert_chunked(cursor, text):
+    """ Inserts text at cursor, breaking lines that would grow longer than CHUNK_CHARS with soft breaks """
+    enable(cursor.document())
+    cursor.beginEditBlock()  # Otherwise the layout is updated after every piece
+    short = []  # Lines not inserted yet, joined by newlines. The first goes on the cursor's block
+    for line in text.split("\n"):
+        column = 0 if short else cursor.positionInBlock()
+        if column + len(line) <= CHUNK_CHARS:
+            short.append(line)
+            continue
+
+        if short:
+            cursor.insertText("\n".join(short) + "\n", PLAIN_FORMAT)
+            column = 0
+        start = 0  # Sliced by offset, slicing off the rest each time would copy a huge line over and over
+        while column + len(line) - start > CHUNK_CHARS:
+            end = start + max(0, CHUNK_CHARS - column)
+            cursor.insertText(line[start:end], PLAIN_FORMAT)
+            cursor.insertBlock(QTextBlockFormat(), SOFT_BREAK_FORMAT)
+            start = end
+            column = 0
+        cursor.insertText(line[start:], PLAIN_FORMAT)
+        short = [""]  # The next line starts after a newline
+    if short != [""]:
+        cursor.insertText("\n".join(short), PLAIN_FORMAT)
+    cursor.endEditBlock()
+
+
+def insert_text(cursor, text, soft_breaks=()):
+    """ Inserts text with the newlines at the given offsets in it as soft breaks, the way the journal replays them """
+    if soft_breaks:
+        enable(cursor.document())
+    start = 0
+    for offset in soft_breaks:
+        cursor.insertText(text[start:offset], PLAIN_FORMAT)
+        cursor.insertBlock(QTextBlockFormat(), SOFT_BREAK_FORMAT)
+        start = offset + 1
+    cursor.insertText(text[start:], PLAIN_FORMAT)
+
+
+def insert_split(cursor, text, offsets):
+    """ Inserts text with soft breaks at the given offsets into it, laying it out as soft_break_offsets recorded """
+    if offsets:
+        enable(cursor.document())
+    cursor.beginEditBlock()
+    start = 0
+    for offset in offsets:
+        cursor.insertText(text[start:offset], PLAIN_FORMAT)
+        cursor.insertBlock(QTextBlockFormat(), SOFT_BREAK_FORMAT)
+        start = offset
+    cursor.insertText(text[start:], PLAIN_FORMAT)
+    cursor.endEditBlock()
+
+
+def mark_soft_breaks(document, block_numbers):
+    """ Turns the breaks before the given blocks into soft breaks """
+    if block_numbers:
+        enable(document)
+    for number in block_numbers:
+        QTextCursor(document.findBlockByNumber(number)).setBlockCharFormat(SOFT_BREAK_FORMAT)
+    if block_numbers:
+        line_map(document).invalidate()  # The block count didn't change
+
+
+def soft_breaks(document):
+    """ Numbers of the blocks that continue the line before them """
+    lines = line_map(document)
+    return list(lines.continuations()) if lines is not None else []
+
+
+def soft_break_offsets(document):
+    """ Offsets into plain_text(document) of its soft breaks """
+    return [document.findBlockByNumber(number).position() - 1 - index for index, number in enumerate(soft_breaks(document))]
+
+
+def soft_breaks_between(document, start, end):
+    """ Offsets from start of the soft breaks in the document between start and end """
+    if line_map(document) is None:
+        return []
+    offsets = []
+    block = document.findBlock(start).next()
+    while block.isValid() and block.position() <= end:
+        if is_continuation(block):
+            offsets.append(block.position() - 1 - start)
+        block = block.next()
+    return offsets
+
+
+def selected_text(cursor):
+    """ The text of a cursor's selection as it is saved, newlines as "\\n" and soft breaks left out """
+    start = cursor.selectionStart()
+    text = cursor.selectedText().replace("\u2029", "\n")
+    pieces = []
+    previous = 0
+    for offset in soft_breaks_between(cursor.document(), start, cursor.selectionEnd()):
+        pieces.append(text[previous:offset])
+        previous = offset + 1
+    pieces.append(text[previous:])
+    return "".join(pieces)
+
+
+def plain_text(document):
+    """ The document's text as it is saved, soft breaks left out """
+    text = document.toPlainText()
+    lines = line_map(document)
+    if lines is None:
+        return text
+
+    pieces = []
+    start = 0
+    for number in lines.continuations():
+        separator = document.findBlockByNumber(number).position() - 1
+        pieces.append(text[start:separator])
+        start = separator + 1
+    pieces.append(text[start:])
+    return "".join(pieces)
+
+
+def find_line(document, line):
+    """ The first block of a line counted from 0 """
+    lines = line_map(document)
+    number = lines.block_of_line(line) if lines is not None else line
+    return document.findBlockByNumber(min(number, document.blockCount() - 1))
+
+
+class LineMap(QObject):
+    """ Marks a document as being in long-line mode and maps its block numbers to line numbers.
+
+    The blocks that are continuations are found once and kept until blocks are added or removed.
+    """
+
+    def __init__(self, document):
+        super().__init__(document)
+        self.document = document
+        self.continuation_blocks = None  # Sorted numbers of the continuation blocks, None when out of date
+        document.blockCountChanged.connect(self.invalidate)
+
+    def invalidate(self):
+        self.continuation_blocks = None
+
+    def continuations(self):
+        if self.continuation_blocks is None:
+            self.continuation_blocks = []
+            block = self.document.begin()
+            while block.isValid():
+                if is_continuation(block):
+                    self.continuation_blocks.append(block.blockNumber())
+                block = block.next()
+        return self.continuation_blocks
+
+    def line_of_block(self, number):
+        """ The line a block is part of, counted from 0 """
+        return number - bisect.bisect_right(self.continuations(), number)
+
+    def block_of_line(self, line):
+        """ The number of the block a line starts in """
+        continuations = self.continuations()
+        low, high = line, line + len(continuations)  # Each continuation before it pushes the line down a block
+        while low < high:
+            middle = (low + high) // 2
+            if middle - bisect.bisect_right(continuations, middle) < line:
+                low = middle + 1
+            else:
+                high = middle
+        return low
@@ -0,0 +1,228 @@
+from PyQt5.QtWidgets import QLabel
+from PyQt5.QtCore import Qt, QObject, QEvent, QTimer, QStandardPaths
+from PyQt5.QtGui import QFontDatabase
+from collections import deque
+import functools
+import json
+import time
+import sys
+import os
+
+MAX_SAMPLES = 5000  # Most recent timings kept per metric, percentiles are over this window
+
+# Hot paths are only wrapped while instrumentation is enabled, so when it's off they run untouched
+enabled = False
+histograms = {}  # Metric name -> RollingHistogram
+_hot_paths = []  # (owner, attribute, metric name) registered with instrument
+_originals = {}  # (owner, attribute) -> what the owner itself held (None if inherited), while enabled
+_started = {}  # Metric name -> start time of a span opened with begin
+
+
+class RollingHistogram:
+    """ The last MAX_SAMPLES timings of one metric, in seconds """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.samples = deque(maxlen=max_samples)
+        self.count = 0  # Every sample ever added, not just the ones in the window
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count}
+
+        def percentile(fraction):
+            return samples[min(len(samples) - 1, int(len(samples) * fraction))] * 1000
+
+        return {
+            "count": self.count,
+            "mean_ms": sum(samples) / len(samples) * 1000,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+def record(name, seconds):
+    histogram = histograms.get(name)
+    if histogram is None:
+        histogram = histograms[name] = RollingHistogram()
+    histogram.add(seconds)
+
+
+def timed(function, name):
+    """ Wraps function so every call is recorded under name """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument(owner, attribute, name):
+    """ Registers a method of a class (or a function of a module) to be timed while instrumentation is on """
+    _hot_paths.append((owner, attribute, name))
+    if enabled:
+        _wrap(owner, attribute, name)
+
+
+def _wrap(owner, attribute, name):
+    _originals[(owner, attribute)] = vars(owner).get(attribute)
+    setattr(owner, attribute, timed(getattr(owner, attribute), name))
+
+
+def enable():
+    global enabled
+    if enabled:
+        return
+    enabled = True
+    for owner, attribute, name in _hot_paths:
+        _wrap(owner, attribute, name)
+
+
+def disable():
+    global enabled
+    enabled = False
+    for (owner, attribute), function in _originals.items():
+        if function is None:
+            delattr(owner, attribute)  # Inherited, uncover the base class's again
+        else:
+            setattr(owner, attribute, function)
+    _originals.clear()
+    _started.clear()
+
+
+def begin(name):
+    """ Opens a span that end records, for work that finishes in a later event such as a signal """
+    if enabled:
+        _started[name] = time.perf_counter()
+
+
+def end(name):
+    start = _started.pop(name, None)
+    if start is not None:
+        record(name, time.perf_counter() - start)
+
+
+def trace_path():
+    """ A new file in the cache folder for a trace dumped now """
+    folder = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), "qwerty", "perf")
+    return os.path.join(folder, time.strftime("trace-%Y%m%d-%H%M%S.json"))
+
+
+def dump(path=None):
+    """ Writes the summaries and sample windows of every metric as JSON, returns the path written """
+    path = path or trace_path()
+    trace = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "metrics": {
+            name: dict(histogram.summary(), samples_ms=[round(sample * 1000, 4) for sample in histogram.samples])
+            for name, histogram in sorted(histograms.items())
+        },
+    }
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(trace, file, indent=1)
+    return path
+
+
+class LatencyProbe(QObject):
+    """ Measures keystroke-to-paint latency, from a key press reaching the editor until its viewport has been painted """
+
+    def __init__(self, editor):
+        super().__init__(editor)
+        self.editor = editor
+        self.pressed = None  # Time of the oldest key press not painted yet
+        editor.installEventFilter(self)
+        editor.viewport().installEventFilter(self)
+
+    def remove(self):
+        self.editor.removeEventFilter(self)
+        self.editor.viewport().removeEventFilter(self)
+        self.deleteLater()
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.KeyPress and self.pressed is None:
+            self.pressed = time.perf_counter()
+        elif event.type() == QEvent.Paint and self.pressed is not None and obj is self.editor.viewport():
+            # Filters run before the paint, the timer fires once it has been handled and flushed
+            QTimer.singleShot(0, self.painted)
+        return False
+
+    def painted(self):
+        if self.pressed is not None:
+            record("keystroke_to_paint", time.perf_counter() - self.pressed)
+            self.pressed = None
+
+
+class PerfOverlay(QLabel):
+    """ Live table of the rolling percentiles, drawn over the top right corner of its parent """
+
+    REFRESH_MS = 500
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)  # Clicks go through to the editor below
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setStyleSheet("background-color: rgba(20, 22, 26, 210); color: #abb2bf; padding: 6px;")
+        self.hide()
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+    def toggle(self):
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start()
+
+    def refresh(self):
+        lines = [f"{'metric':<22}{'count':>8}{'p50':>9}{'p95':>9}{'p99':>9}"]
+        for name, histogram in sorted(histograms.items()):
+            summary = histogram.summary()
+            if "p50_ms" in summary:
+                lines.append(f"{name:<22}{summary['count']:>8}{summary['p50_ms']:>9.2f}{summary['p95_ms']:>9.2f}{summary['p99_ms']:>9.2f}")
+        if len(lines) == 1:
+            lines.append("No samples yet")
+        self.setText("\n".join(lines))
+        self.adjustSize()
+        self.move(self.parentWidget().width() - self.width() - 8, 8)
+
+
+class StartupProfile:
+    """ Wall-clock time of each phase of startup, printed when run with --profile-startup """
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []  # (phase, seconds since the previous mark)
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, file=None):
+        lines = [f"{phase:<24}{seconds * 1000:>9.1f} ms" for phase, seconds in self.phases]
+        lines.append(f"{'total':<24}{(self.last - self.started) * 1000:>9.1f} ms")
+        print("Startup profile\n" + "\n".join(lines), file=file or sys.stderr)
+
+
+startup_profile = None  # Set when profiling startup
+
+
+def mark_startup(phase):
+    if startup_profile is not None:
+        startup_profile.mark(phase)
@@ -0,0 +1,312 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLineEdit, QCheckBox, QPushButton, QLabel, QTreeWidget, QTreeWidgetItem
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
+import mmap
+import os
+import re
+
+MMAP_THRESHOLD_BYTES = 1024 * 1024  # Files this big are mapped instead of read into memory
+BINARY_SNIFF_BYTES = 8192  # A NUL byte in this much of a file marks it as binary
+MAX_MATCHES_PER_FILE = 1000
+MAX_PREVIEW_BYTES = 300  # Longest part of a matching line shown in the results
+
+_pool = None
+
+
+def shared_pool():
+    """ Returns the process pool searches run on, started on first use and kept for later searches """
+    global _pool
+    if _pool is None:
+        # Imported here, concurrent.futures and multiprocessing are a noticeable part of startup otherwise
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+
+        # Spawned rather than forked, forking a process that is running Qt threads isn't safe
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def compile_query(query, regex=False, match_case=False):
+    """ Compiles a search into a bytes pattern, raises re.error for an invalid regex """
+    source = query.encode("utf-8")
+    if not regex:
+        source = re.escape(source)
+    return re.compile(source, re.MULTILINE if match_case else re.MULTILINE | re.IGNORECASE)
+
+
+def search_file(path, pattern, folded_pattern=None):
+    """ Returns [(line number, preview)] of the lines of a file matching pattern, [] for binary files.
+
+    folded_pattern is a case-sensitive form of pattern to run on lowercased text instead, when it is cheaper.
+    """
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return []
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size >= MMAP_THRESHOLD_BYTES else file.read()
+
+    try:
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            return []
+
+        # Lowercasing a copy keeps the regex engine's fast literal scan, which IGNORECASE turns off
+        haystack = data
+        if folded_pattern is not None and not isinstance(data, mmap.mmap):
+            haystack = data.lower()
+            pattern = folded_pattern
+
+        matches = []
+        line = 0
+        counted = 0
+        position = 0
+        while len(matches) < MAX_MATCHES_PER_FILE:
+            match = pattern.search(haystack, position)
+            if match is None:
+                break
+
+            start = match.start()
+            line_start = haystack.rfind(b"\n", 0, start) + 1
+            line_end = haystack.find(b"\n", start)
+            if line_end < 0:
+                line_end = size
+
+            line += haystack[counted:line_start].count(b"\n")
+            counted = line_start
+            preview = data[line_start:min(line_end, line_start + MAX_PREVIEW_BYTES)]
+            matches.append((line, preview.decode("utf-8", errors="replace").rstrip("\r")))
+
+            # One result per line, which also gets past empty matches
+            position = line_end + 1
+        return matches
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+
+def search_batch(paths, query, regex, match_case):
+    """ Searches a batch of files in a worker process, returns [(path, matches)] for files that matched """
+    pattern = compile_query(query, regex, match_case)
+    folded_pattern = None
+    if not regex and not match_case:
+        folded_pattern = re.compile(re.escape(query.encode("utf-8").lower()))  # bytes.lower only folds ASCII, like IGNORECASE
+
+    results = []
+    for path in paths:
+        try:
+            matches = search_file(path, pattern, folded_pattern)
+        except (OSError, ValueError):
+            continue  # Vanished or unreadable since it was indexed
+        if matches:
+            results.append((path, matches))
+    return results
+
+
+class ProjectSearch(QThread):
+    """ Feeds batches of files to the process pool and streams back matches as batches complete """
+
+    found = pyqtSignal(object)  # [(path, [(line number, preview)])]
+    progress = pyqtSignal(int, int)  # Files searched, total files
+    finished_searching = pyqtSignal(bool)  # Whether the result limit cut the search short
+    failed = pyqtSignal(str)
+
+    BATCH_FILES = 64
+    MAX_RESULTS = 20000  # Matching lines after which the search stops
+
+    def __init__(self, paths, query, regex=False, match_case=False, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.query = query
+        self.regex = regex
+        self.match_case = match_case
+
+    def cancel(self):
+        self.requestInterruption()
+
+    def run(self):
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = shared_pool()
+        batches = (self.paths[i:i + self.BATCH_FILES] for i in range(0, len(self.paths), self.BATCH_FILES))
+        max_in_flight = 2 * (os.cpu_count() or 1)  # Enough to keep every worker busy, few enough to cancel quickly
+
+        in_flight = {}
+        searched = 0
+        results = 0
+        limited = False
+        try:
+            while not self.isInterruptionRequested():
+                for batch in batches:
+                    in_flight[pool.submit(search_batch, batch, self.query, self.regex, self.match_case)] = len(batch)
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, timeout=0.1, return_when=FIRST_COMPLETED)
+                found = []
+                for future in done:
+                    searched += in_flight.pop(future)
+                    found.extend(future.result())
+                if found:
+                    self.found.emit(found)
+                    results += sum(len(matches) for _, matches in found)
+                    if results >= self.MAX_RESULTS:
+                        limited = True
+                        break
+                if done:
+                    self.progress.emit(searched, len(self.paths))
+        except BrokenProcessPool as e:
+            shutdown_pool()  # A worker died, start a fresh pool next time
+            self.failed.emit(str(e))
+            return
+        finally:
+            for future in in_flight:
+                future.cancel()
+        self.finished_searching.emit(limited)
+
+
+class SearchPanel(QWidget):
+    """ Find in files over the workspace index, with results grouped by file """
+
+    result_activated = pyqtSignal(str, int)  # Path, line number counted from 0
+
+    def __init__(self, file_index, parent=None):
+        super().__init__(parent)
+        self.file_index = file_index
+        self.search = None
+        self.match_count = 0
+
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Search in files")
+        self.query_edit.returnPressed.connect(self.start_search)
+        self.regex_check = QCheckBox("Regex")
+        self.case_check = QCheckBox("Match case")
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.toggle_search)
+        self.status_label = QLabel()
+
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setUniformRowHeights(True)  # Lets the view skip measuring thousands of rows
+        self.results.itemActivated.connect(self.open_result)
+
+        bar = QHBoxLayout()
+        bar.addWidget(self.query_edit)
+        bar.addWidget(self.regex_check)
+        bar.addWidget(self.case_check)
+        bar.addWidget(self.search_button)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(bar)
+        layout.addWidget(self.status_label)
+        layout.addWidget(self.results)
+
+    def focus_query(self, text=""):
+        if text:
+            self.query_edit.setText(text)
+        self.query_edit.selectAll()
+        self.query_edit.setFocus()
+
+    def toggle_search(self):
+        if self.search is not None:
+            self.cancel_search()
+        else:
+            self.start_search()
+
+    def start_search(self):
+        self.cancel_search()
+        query = self.query_edit.text()
+        if not query:
+            return
+
+        try:
+            compile_query(query, self.regex_check.isChecked(), self.case_check.isChecked())
+        except re.error as e:
+            self.status_label.setText(f"Invalid regex: {e}")
+            return
+
+        if self.file_index.root is None:
+            self.status_label.setText("Open a folder to search the files in it.")
+            return
+        if not self.file_index.ready:
+            self.status_label.setText("The workspace is still being indexed, try again in a moment.")
+            return
+
+        self.results.clear()
+        self.match_count = 0
+        paths = [self.file_index.absolute(path) for path in self.file_index.paths]
+
+        self.search = ProjectSearch(paths, query, self.regex_check.isChecked(), self.case_check.isChecked(), self)
+        self.search.found.connect(self.add_results)
+        self.search.progress.connect(self.show_progress)
+        self.search.finished_searching.connect(self.search_finished)
+        self.search.failed.connect(self.search_failed)
+        self.search.finished.connect(self.search.deleteLater)
+        self.search_button.setText("Cancel")
+        self.status_label.setText(f"Searching {len(paths)} files...")
+        self.search.start()
+
+    def cancel_search(self):
+        if self.search is None:
+            return
+
+        search, self.search = self.search, None
+        search.cancel()
+        search.wait()  # At most one wait on the pool, workers finish their batch in the background
+        self.search_button.setText("Search")
+        self.status_label.setText(f"Cancelled, {self.match_count} matches so far.")
+
+    def add_results(self, found):
+        if self.sender() is not self.search:
+            return
+
+        root = self.file_index.root
+        self.results.setUpdatesEnabled(False)  # One repaint for the whole batch
+        for path, matches in found:
+            file_item = QTreeWidgetItem([f"{os.path.relpath(path, root)} ({len(matches)})"])
+            file_item.addChildren([self.match_item(path, line, preview) for line, preview in matches])
+            self.results.addTopLevelItem(file_item)
+            file_item.setExpanded(True)
+            self.match_count += len(matches)
+        self.results.setUpdatesEnabled(True)
+
+    def match_item(self, path, line, preview):
+        item = QTreeWidgetItem([f"{line + 1}: {preview.strip()}"])
+        item.setData(0, Qt.UserRole, (path, line))
+        return item
+
+    def show_progress(self, searched, total):
+        if self.sender() is self.search:
+            self.status_label.setText(f"Searched {searched} of {total} files, {self.match_count} matches...")
+
+    def search_finished(self, limited):
+        if self.sender() is not self.search:
+            return
+
+        self.search = None
+        self.search_button.setText("Search")
+        if limited:
+            self.status_label.setText(f"Stopped after {self.match_count} matches, narrow the search to see the rest.")
+        else:
+            self.status_label.setText(f"{self.match_count} matches in {self.results.topLevelItemCount()} files.")
+
+    def search_failed(self, message):
+        if self.sender() is not self.search:
+            return
+
+        self.search = None
+        self.search_button.setText("Search")
+        self.status_label.setText(f"Search failed: {message}")
+
+    def open_result(self, item):
+        location = item.data(0, Qt.UserRole)
+        if location is not None:
+            self.result_activated.emit(*location)
@@ -0,0 +1,62 @@
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLineEdit, QListWidget
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+
+
+class QuickOpenDialog(QDialog):
+    """ Palette that fuzzy-finds a file of the workspace index by name """
+
+    file_chosen = pyqtSignal(str)  # Absolute path
+
+    MAX_RESULTS = 50
+
+    def __init__(self, index, parent=None):
+        super().__init__(parent)
+        self.index = index
+
+        self.setWindowTitle("Go to File")
+        self.resize(500, 400)
+
+        self.query_edit = QLineEdit()
+        self.query_edit.setPlaceholderText("Type a file name")
+        self.query_edit.installEventFilter(self)
+        self.query_edit.returnPressed.connect(self.accept)
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.accept)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.query_edit)
+        layout.addWidget(self.results)
+
+        # Typing only schedules a lookup, so a burst of keystrokes is searched once
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(0)
+        self.search_timer.timeout.connect(self.update_results)
+        self.query_edit.textChanged.connect(self.search_timer.start)
+        self.index.updated.connect(self.search_timer.start)  # Results fill in as the index arrives
+
+    def show_palette(self):
+        self.query_edit.selectAll()
+        self.update_results()
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.query_edit.setFocus()
+
+    def update_results(self):
+        self.results.clear()
+        self.results.addItems(self.index.search(self.query_edit.text(), self.MAX_RESULTS))
+        self.results.setCurrentRow(0)
+
+    def eventFilter(self, obj, event):
+        # Arrow keys move through the results while the cursor stays in the query
+        if obj is self.query_edit and event.type() == event.KeyPress and event.key() in (Qt.Key_Up, Qt.Key_Down, Qt.Key_PageUp, Qt.Key_PageDown):
+            self.results.keyPressEvent(event)
+            return True
+        return super().eventFilter(obj, event)
+
+    def accept(self):
+        item = self.results.currentItem()
+        if item is not None:
+            self.file_chosen.emit(self.index.absolute(item.text()))
+        super().accept()
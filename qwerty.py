@@ -1,16 +1,35 @@
+import time
+STARTED = time.perf_counter()  # Before the imports, so --profile-startup can include them
+
 import sys
 import os
-import shutil
-import threading
-import subprocess
 
 import highlighter
 import editorarea
+import fileloader
+import filesaver
+import workspace
+import fileindex
+import quickopen
+import projectsearch
+import symbols
+import runner
+import documents
+import longlines
+import fileops
+import journal
+import perf
 import rpc
 
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QFileDialog, QTreeView, QSplitter, QFileSystemModel, QShortcut, QMenu, QAction, QMessageBox, QInputDialog
-from PyQt5.QtCore import Qt, QDir, QSettings
-from PyQt5.QtGui import QIcon, QFontMetricsF
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QFileDialog, QTreeView, QSplitter, QFileSystemModel, QShortcut, QMenu, QAction, QMessageBox, QInputDialog, QProgressBar, QPushButton, QTabWidget, QTabBar, QToolTip, QLabel
+from PyQt5.QtCore import Qt, QDir, QSettings, QEvent, QTimer
+from PyQt5.QtGui import QIcon, QTextCursor
+
+# Hot paths timed while performance instrumentation is on
+perf.instrument(highlighter.Highlighter, "highlightBlock", "highlight_block")
+perf.instrument(editorarea.CodeEditor, "line_number_paint_event", "gutter_paint")
+perf.instrument(documents, "new_document", "new_document")
+perf.instrument(workspace.WorkspaceFilterModel, "filterAcceptsRow", "fs_model_filter_row")
 
 class TextEditorApp(QWidget):
     def __init__(self):
@@ -28,13 +47,18 @@ class TextEditorApp(QWidget):
         self.text_edit = editorarea.CodeEditor()
         self.text_edit.setPlaceholderText("Code Something.")
 
-        # Create the folder hierarchy view
+        self.settings = QSettings("lolguy", "Qwerty")  # Use an identifier for your app
+
+        # Create the folder hierarchy view, only watching the workspace and hiding ignored entries
         self.folder_model = QFileSystemModel()
-        self.folder_model.setRootPath(QDir.rootPath())
+        self.folder_model.setOption(QFileSystemModel.DontUseCustomDirectoryIcons)
+        self.folder_model.directoryLoaded.connect(self.directory_loaded)
+        self.tree_filter = workspace.WorkspaceFilterModel()
+        self.tree_filter.setSourceModel(self.folder_model)
 
         # Create the file explorer tree view (initially empty)
         self.tree_view = QTreeView()
-        self.tree_view.setModel(self.folder_model)
+        self.tree_view.setModel(self.tree_filter)
         self.tree_view.setHeaderHidden(True)
 
         self.tree_view.doubleClicked.connect(self.open_file)
@@ -43,38 +67,204 @@ class TextEditorApp(QWidget):
         self.tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree_view.customContextMenuRequested.connect(self.show_context_menu)
 
+        # Tabs of the open files above the editor, each file keeps its own document
+        self.tab_bar = QTabBar()
+        self.tab_bar.setTabsClosable(True)
+        self.tab_bar.setMovable(True)
+        self.tab_bar.setDocumentMode(True)
+        self.tab_bar.setExpanding(False)
+        self.tab_bar.currentChanged.connect(self.tab_changed)
+        self.tab_bar.tabCloseRequested.connect(self.close_tab)
+
+        self.editor_pane = QWidget()
+        self.editor_layout = QVBoxLayout(self.editor_pane)
+        self.editor_layout.setContentsMargins(0, 0, 0, 0)
+        self.editor_layout.setSpacing(0)
+        self.editor_layout.addWidget(self.tab_bar)
+
+        # Shown while the document has lines too long to lay out whole, which are split over several rows
+        self.long_line_banner = QLabel(f"Long-line mode: lines over {longlines.CHUNK_CHARS} characters are split into rows, not wrapped or highlighted")
+        self.long_line_banner.setObjectName("longLineBanner")
+        self.long_line_banner.hide()
+        self.text_edit.long_line_mode_changed.connect(self.long_line_banner.setVisible)
+        self.editor_layout.addWidget(self.long_line_banner)
+        self.editor_layout.addWidget(self.text_edit)
+
         # Add the text editor and tree view to the layout
-        splitter = QSplitter()
-        splitter.addWidget(self.tree_view)
-        splitter.addWidget(self.text_edit)
-        splitter.setSizes([200, 600])
-        layout.addWidget(splitter)
+        self.splitter = QSplitter()
+        self.splitter.addWidget(self.tree_view)
+        self.splitter.addWidget(self.editor_pane)
+        self.splitter.setSizes([200, 600])
+
+        # Panels below the editor (search results, script output), hidden until one is opened
+        self.panels = QTabWidget()
+        self.panels.hide()
+        self.panel_splitter = QSplitter(Qt.Vertical)
+        self.panel_splitter.addWidget(self.splitter)
+        self.panel_splitter.addWidget(self.panels)
+        self.panel_splitter.setSizes([400, 200])
+        layout.addWidget(self.panel_splitter)
+
+        # Progress of a file being loaded in the background, hidden otherwise
+        self.load_progress = QProgressBar()
+        self.load_cancel_button = QPushButton("Cancel")
+        self.load_cancel_button.clicked.connect(self.cancel_loading)
+
+        load_bar = QHBoxLayout()
+        load_bar.addWidget(self.load_progress)
+        load_bar.addWidget(self.load_cancel_button)
+        layout.addLayout(load_bar)
+        self.load_progress.hide()
+        self.load_cancel_button.hide()
+
+        # Deletes, creates, moves and copies from the tree run on a background queue, shown here while busy
+        self.file_operations = fileops.FileOperationQueue(self)
+        self.file_operations.operation_finished.connect(self.file_operation_finished)
+        self.file_operations.start()
+        self.operation_status = fileops.OperationStatus(self.file_operations)
+        layout.addWidget(self.operation_status)
+
+        # Open files, their documents kept within a memory budget and the least recently used ones snapshotted
+        self.documents = documents.DocumentCache(self.settings.value("documentCacheMB", 256, type=int) * 1024 * 1024)
+        self.current_document = None
+        self.current_file = None
+
+        # Unsaved edits are logged to disk as they are made, so a crash can't take them along. The editor's own
+        # document would be deleted with the first file opened, so the untitled one is kept by its journal instead
+        untitled = documents.new_document()
+        self.text_edit.set_document(untitled)
+        self.untitled_journal = journal.EditJournal(untitled)
+        self.session_lock = None
+
+        # Background reader of the file being opened, and the viewer shown instead of the editor for a huge or binary file
+        self.file_reader = None
+        self.loading_document = None
+        self.queued_loads = []  # Files opened while another was streaming in, loaded in turn
+        self.paged_viewer = None
+        self.pending_line = None  # Line to jump to once it has been loaded
+
+        # Saves run on a background writer so slow disks don't freeze the editor
+        self.document_saver = filesaver.DocumentSaver(self)
+        self.document_saver.saved.connect(self.file_saved)
+        self.document_saver.failed.connect(self.save_failed)
+
+        # Index of every file in the workspace, built in the background for quick open
+        self.file_index = fileindex.WorkspaceIndex(self)
+        self.quick_open = quickopen.QuickOpenDialog(self.file_index, self)
+        self.quick_open.file_chosen.connect(self.open_path)
+
+        # Find in files, searching the indexed files on a process pool
+        self.search_panel = projectsearch.SearchPanel(self.file_index)
+        self.search_panel.result_activated.connect(self.open_path)
+        self.panels.addTab(self.search_panel, "Search")
+
+        # Output of scripts run with Ctrl+B
+        self.output_panel = runner.OutputPanel(self.settings)
+        self.panels.addTab(self.output_panel, "Output")
+
+        # Definitions of the workspace's Python symbols for go to definition, parsed on the process pool like searches
+        self.symbol_index = symbols.SymbolIndex(self.file_index, self)
+        self.symbol_index.outline_parsed.connect(self.outline_parsed)
+        self.document_saver.saved.connect(self.symbol_index.file_saved)
+
+        # Outline of the current Python file, parsed again once typing pauses
+        self.outline_panel = symbols.OutlinePanel()
+        self.outline_panel.line_activated.connect(self.go_to_line)
+        self.panels.addTab(self.outline_panel, "Outline")
+        self.panels.currentChanged.connect(lambda index: self.update_outline())
+        self.outline_text = None  # Text the outline was last parsed from
+        self.outline_request = 0  # Bumped per parse, so a slow result for older text is dropped
+        self.outline_timer = QTimer(self)
+        self.outline_timer.setSingleShot(True)
+        self.outline_timer.setInterval(500)
+        self.outline_timer.timeout.connect(self.update_outline)
+        self.text_edit.textChanged.connect(self.outline_timer.start)
 
         self.setLayout(layout)
 
+        # Performance instrumentation, on while the overlay is shown or for the whole run with QWERTY_PERF=1
+        self.perf_overlay = perf.PerfOverlay(self)
+        self.latency_probe = None
+        self.perf_always_on = os.environ.get("QWERTY_PERF") == "1"
+        if self.perf_always_on:
+            self.enable_perf()
+
+        perf.mark_startup("build window")
+
         # Apply dark theme (One Dark background style)
         with open("style.qss", "r") as file:
             data = file.read()
             self.setStyleSheet(data)
+        perf.mark_startup("style sheet")
+
+        # Populating the tree, indexing the workspace and connecting to Discord wait until the window has painted
+        self.started_up = False
+        self.presence = None
 
         # Set keyboard shortcuts
         self.set_shortcuts()
         self.installEventFilter(self)
 
-        # Set up the Python highlighter for the text editor
-        self.highlighter = None
+        self.last_folder = self.settings.value("lastOpenedFolder", None)  # Only a folder the user opened gets indexed
 
-        self.settings = QSettings("lolguy", "Qwerty")  # Use an identifier for your app
-        self.last_folder = self.settings.value("lastOpenedFolder", QDir.homePath())  # Default to home directory
-        self.tree_view.setRootIndex(self.folder_model.index(self.last_folder))
+    def finish_startup(self):
+        """ Starts the subsystems the first paint doesn't need """
+        perf.mark_startup("first paint")
+        if self.last_folder and os.path.isdir(self.last_folder):
+            self.set_workspace(self.last_folder)
+        else:
+            self.show_folder(QDir.homePath())  # Browsable, but too big to walk, watch and parse
+        perf.mark_startup("open workspace")
+
+        self.recover_journals()
+
+        # Finish removing deletes that were still running when the editor last closed
+        for trash in self.settings.value("pendingTrash", [], type=list):
+            if os.path.lexists(trash):
+                self.file_operations.submit(fileops.FileOperation("delete", trash), use_trash=False)
+        self.settings.remove("pendingTrash")
 
-        # discord rpc
+        # Discord presence, connected and updated on its own thread so Discord can't stall the editor
         if rpc.rpc_enable:
-            rpc.update()
+            self.presence = rpc.PresenceWorker()
+            self.presence.start()
+            self.update_presence()
+            perf.mark_startup("discord presence")
+
+        if perf.startup_profile is not None:
+            perf.startup_profile.report()
 
     def closeEvent(self, event):
-        if rpc.rpc_enable:
-            rpc.close()
+        self.queued_loads = []
+        self.cancel_loading()
+        self.document_saver.close()
+        self.search_panel.cancel_search()
+        self.output_panel.kill()
+        self.symbol_index.stop()
+        projectsearch.shutdown_pool()
+        self.file_index.stop()
+
+        # Unsaved edits stay in their journals and are offered back on the next start
+        for open_document in self.documents.open_documents.values():
+            if open_document.journal is not None:
+                open_document.journal.close()
+        if self.untitled_journal is not None:
+            self.untitled_journal.close()
+        if self.session_lock is not None:
+            self.session_lock.unlock()
+
+        leftover_trash = self.file_operations.stop()
+        if leftover_trash:
+            self.settings.setValue("pendingTrash", leftover_trash)
+
+        if perf.enabled:
+            try:
+                perf.dump()
+            except OSError:
+                pass  # Nowhere to report it while closing
+
+        if self.presence is not None:
+            self.presence.stop()
 
     def set_shortcuts(self):
         # Ctrl+F for opening folder
@@ -97,8 +287,36 @@ class TextEditorApp(QWidget):
         self.ctrl_b_shortcut = QShortcut(Qt.CTRL + Qt.Key_B, self)
         self.ctrl_b_shortcut.activated.connect(self.run_file)
 
+        # Ctrl+P for quickly opening a file by name
+        self.ctrl_p_shortcut = QShortcut(Qt.CTRL + Qt.Key_P, self)
+        self.ctrl_p_shortcut.activated.connect(self.quick_open.show_palette)
+
+        # Ctrl+Shift+F for searching in all files
+        self.ctrl_shift_f_shortcut = QShortcut(Qt.CTRL + Qt.SHIFT + Qt.Key_F, self)
+        self.ctrl_shift_f_shortcut.activated.connect(self.show_search_panel)
+
+        # Ctrl+W for closing the current tab
+        self.ctrl_w_shortcut = QShortcut(Qt.CTRL + Qt.Key_W, self)
+        self.ctrl_w_shortcut.activated.connect(self.close_current_tab)
+
+        # Ctrl+Shift+I for the performance overlay, Ctrl+Shift+T for writing out a performance trace
+        self.ctrl_shift_i_shortcut = QShortcut(Qt.CTRL + Qt.SHIFT + Qt.Key_I, self)
+        self.ctrl_shift_i_shortcut.activated.connect(self.toggle_perf_overlay)
+        self.ctrl_shift_t_shortcut = QShortcut(Qt.CTRL + Qt.SHIFT + Qt.Key_T, self)
+        self.ctrl_shift_t_shortcut.activated.connect(self.dump_perf_trace)
+
+        # F12 for going to the definition of the word under the cursor, Ctrl+Shift+O for the outline
+        self.f12_shortcut = QShortcut(Qt.Key_F12, self)
+        self.f12_shortcut.activated.connect(self.go_to_definition)
+        self.ctrl_shift_o_shortcut = QShortcut(Qt.CTRL + Qt.SHIFT + Qt.Key_O, self)
+        self.ctrl_shift_o_shortcut.activated.connect(self.show_outline_panel)
+
     def eventFilter(self, obj, event):
         """Capture keyboard events for font resizing manually."""
+        if not self.started_up and obj is self and event.type() == QEvent.Paint:
+            # The rest of the window paints in the same pass, the timer fires once it is on screen
+            self.started_up = True
+            QTimer.singleShot(0, self.finish_startup)
         if event.type() == event.KeyPress and event.modifiers() == Qt.ControlModifier:
             if event.key() == Qt.Key_Plus or event.key() == Qt.Key_Equal:  # Handle Ctrl+Plus (including Shift variations)
                 self.adjust_font_size(2)
@@ -116,8 +334,11 @@ class TextEditorApp(QWidget):
         self.text_edit.setFont(current_font)
 
     def run_file(self):
-        if self.current_file.endswith(".py"):
-            os.system(f'start cmd /c "py {self.current_file}"')
+        # Run in a child process with its output streamed into the output panel
+        if self.current_file and self.current_file.endswith(".py"):
+            self.panels.show()
+            self.panels.setCurrentWidget(self.output_panel)
+            self.output_panel.run(self.current_file)
         else:
             QMessageBox.warning(self, "Error", "No Python file selected to run.")
 
@@ -126,42 +347,579 @@ class TextEditorApp(QWidget):
         folder = QFileDialog.getExistingDirectory(self, "Choose Folder", QDir.rootPath())
         if folder:
             # Set the root index to the chosen folder
-            self.tree_view.setRootIndex(self.folder_model.index(folder))
+            self.set_workspace(folder)
             self.settings.setValue("lastOpenedFolder", folder)
 
+    def set_workspace(self, folder):
+        # Shows the folder in the tree and indexes its files and symbols for quick open, search and go to definition
+        excludes = self.show_folder(folder)
+        self.file_index.set_root(folder, excludes)
+        self.symbol_index.set_root(folder)
+
+    def show_folder(self, folder):
+        # Root the model at the folder so only it is watched, with its .gitignore files and the user's excludes applied
+        excludes = self.settings.value("excludePatterns", workspace.DEFAULT_EXCLUDES, type=list)
+        self.workspace_rules = workspace.IgnoreRules(folder, excludes)
+        self.tree_filter.set_rules(self.workspace_rules)
+        perf.begin("fs_model_load_root")
+        self.folder_model.setRootPath(folder)
+        self.tree_view.setRootIndex(self.tree_filter.mapFromSource(self.folder_model.index(folder)))
+        return excludes
+
+    def directory_loaded(self, path):
+        if path == self.folder_model.rootPath():
+            perf.end("fs_model_load_root")
+
+    def enable_perf(self):
+        perf.enable()
+        if self.latency_probe is None:
+            self.latency_probe = perf.LatencyProbe(self.text_edit)
+
+    def disable_perf(self):
+        perf.disable()
+        if self.latency_probe is not None:
+            self.latency_probe.remove()
+            self.latency_probe = None
+
+    def toggle_perf_overlay(self):
+        if self.perf_overlay.isVisible():
+            self.perf_overlay.toggle()
+            if not self.perf_always_on:
+                self.disable_perf()
+        else:
+            self.enable_perf()
+            self.perf_overlay.toggle()
+
+    def dump_perf_trace(self):
+        try:
+            path = perf.dump()
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Could not write the performance trace: {e}")
+            return
+        QMessageBox.information(self, "Performance Trace", f"Written to {path}")
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.perf_overlay.isVisible():
+            self.perf_overlay.refresh()  # Keep it in the corner
+
+    def show_search_panel(self):
+        # Search for the selected text, if any
+        self.panels.show()
+        self.panels.setCurrentWidget(self.search_panel)
+        selection = longlines.selected_text(self.text_edit.textCursor())
+        self.search_panel.focus_query(selection if "\n" not in selection else "")
+
+    def show_outline_panel(self):
+        self.panels.show()
+        self.panels.setCurrentWidget(self.outline_panel)
+        self.update_outline()
+
+    def update_outline(self):
+        # Only parsed while the outline is shown, and only when the text actually changed
+        if not self.panels.isVisible() or self.panels.currentWidget() is not self.outline_panel:
+            return
+        if self.paged_viewer is not None or self.current_file is None or not self.current_file.endswith(symbols.PYTHON_EXTENSIONS):
+            self.outline_request += 1
+            self.outline_text = None
+            self.outline_panel.clear()
+            return
+
+        text = longlines.plain_text(self.text_edit.document())
+        if text == self.outline_text:
+            return
+        self.outline_text = text
+        self.outline_request += 1
+        self.symbol_index.parse_outline(self.outline_request, text)
+
+    def outline_parsed(self, request, found):
+        # Text that doesn't parse (mid-edit, usually) keeps the last outline up
+        if request == self.outline_request and found is not None:
+            self.outline_panel.show_symbols(found)
+
+    def go_to_definition(self):
+        # Jump to where the word under the cursor is defined, offering a choice when it is defined in several places
+        if self.paged_viewer is not None:
+            return
+        cursor = self.text_edit.textCursor()
+        cursor.select(QTextCursor.WordUnderCursor)
+        name = cursor.selectedText()
+        if not name.isidentifier():
+            return
+
+        definitions = self.symbol_index.definitions(name)
+        position = self.text_edit.viewport().mapToGlobal(self.text_edit.cursorRect().bottomLeft())
+        if not definitions:
+            QToolTip.showText(position, f"No definition of {name} found", self.text_edit)
+        elif len(definitions) == 1:
+            self.open_path(definitions[0][0], definitions[0][1])
+        else:
+            menu = QMenu(self)
+            for path, line, kind, container in definitions:
+                qualified = f"{container}.{name}" if container else name
+                action = menu.addAction(f"{qualified} - {os.path.relpath(path, self.file_index.root)}:{line + 1}")
+                action.triggered.connect(lambda checked, path=path, line=line: self.open_path(path, line))
+            menu.exec_(position)
+
+    def file_path(self, index):
+        # Path of a tree view index, which points into the filter model rather than the file system model
+        return self.folder_model.filePath(self.tree_filter.mapToSource(index))
+
     def open_file(self, index):
         # Get the file path from the index clicked
-        file_path = self.folder_model.filePath(index)
+        file_path = self.file_path(index)
 
         if os.path.isfile(file_path):
-            # Open the file and read its content
-            with open(file_path, "r") as file:
-                content = ""
-                try:
-                    content = file.read()
-                except UnicodeDecodeError:
-                    QMessageBox.warning(self, "Error: ", f"incorrect unicode format")
-                self.text_edit.setPlainText(content)
+            self.open_path(file_path)
+
+    def open_path(self, file_path, line=None):
+        # Switch to the file's tab if it is already open, otherwise open it in a new one
+        file_path = os.path.abspath(file_path)
+        open_document = self.documents.get(file_path)
+        if open_document is None:
+            open_document = self.load_document(file_path)
+            if open_document is None:
+                return
+
+        self.show_document(open_document)
+        if line is not None:
+            self.go_to_line(line)
+
+    def load_document(self, file_path):
+        # The first few KB tell binary files from text and which encoding the text is in
+        try:
+            size = os.path.getsize(file_path)
+            kind, encoding = fileloader.sniff(file_path)
+        except OSError as e:
+            QMessageBox.warning(self, "Error", f"Failed to open the file: {e}")
+            return None
+
+        open_document = documents.OpenDocument(file_path)
+        if kind == "binary" or (size >= fileloader.PAGED_THRESHOLD_BYTES and not fileloader.ascii_compatible(encoding)):
+            # Binary files are shown as a hex dump, mapped rather than read
+            open_document.viewer = fileloader.HexViewer(file_path)
+            open_document.viewer.hide()
+            self.editor_layout.addWidget(open_document.viewer)
+        elif size >= fileloader.PAGED_THRESHOLD_BYTES:
+            # Huge files are paged through a read-only viewer instead of being loaded whole
+            open_document.viewer = fileloader.PagedFileViewer(file_path, encoding)
+            open_document.viewer.hide()
+            self.editor_layout.addWidget(open_document.viewer)
+        else:
+            open_document.encoding = encoding
+            open_document.document = documents.new_document()
+            self.prepare_document(open_document)
+            self.queue_loading(open_document)
+
+        self.add_tab(open_document)
+        return open_document
+
+    def add_tab(self, open_document):
+        self.documents.add(open_document)
+        index = self.tab_bar.addTab(os.path.basename(open_document.path))
+        self.tab_bar.setTabData(index, open_document.path)
+        self.tab_bar.setTabToolTip(index, open_document.path)
+
+    def prepare_document(self, open_document):
+        # Apply syntax highlighting if the file's language is known, visible blocks first and the rest while idle
+        lexer = highlighter.lexer_for_path(open_document.path)
+        if lexer is not None:
+            open_document.highlighter = highlighter.Highlighter(open_document.document, lexer, lazy=True)
+            highlighter.LazyHighlighting(open_document.highlighter, self.text_edit)
+
+        path = open_document.path
+        open_document.document.modificationChanged.connect(lambda modified: self.update_tab_title(path))
+
+    def queue_loading(self, open_document):
+        # One file streams in at a time, the others wait their turn in read-only tabs
+        if self.loading_document is not None:
+            self.queued_loads.append(open_document)
+        else:
+            self.start_loading(open_document)
+
+    def is_loading(self, open_document):
+        return open_document is self.loading_document or open_document in self.queued_loads
+
+    def start_loading(self, open_document):
+        # Stream the file into its document from a background reader, keeping the GUI responsive
+        open_document.document.setUndoRedoEnabled(False)  # Loading shouldn't be something Ctrl+Z can take back
+        self.loading_document = open_document
+
+        errors = "replace" if open_document.lossy else "strict"
+        self.file_reader = fileloader.FileReader(open_document.path, open_document.encoding, errors, parent=self)
+        self.file_reader.chunk_read.connect(self.insert_loaded_text)
+        self.file_reader.progress.connect(self.show_load_progress)
+        self.file_reader.finished_reading.connect(self.finish_loading)
+        self.file_reader.undecodable.connect(self.reload_undecodable)
+        self.file_reader.failed.connect(self.fail_loading)
+        self.file_reader.finished.connect(self.file_reader.deleteLater)
 
-            # Apply Python syntax highlighting if it's a Python file
-            if file_path.endswith(".py"):
-                self.highlighter = highlighter.PythonHighlighter(self.text_edit.document())
+        self.load_progress.setFormat(f"Loading {os.path.basename(open_document.path)}... %p%")
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self.load_cancel_button.show()
+        perf.begin("file_load")
+        self.file_reader.start()
 
-            # Save changes when closing the application or a save button (not yet added, but can be done)
-            self.current_file = file_path
+    def show_document(self, open_document):
+        # Put a file's document (or paged viewer) in view, restoring where it was left
+        previous = self.current_document
+        if previous is not None and previous is not open_document and previous.document is self.text_edit.document():
+            previous.cursor_position = self.text_edit.textCursor().position()
+            previous.scroll_position = self.text_edit.verticalScrollBar().value()
+
+        self.current_document = open_document
+        self.current_file = open_document.path
+        self.pending_line = None
+        self.documents.touch(open_document.path)
+
+        if self.paged_viewer is not None and self.paged_viewer is not open_document.viewer:
+            self.paged_viewer.hide()
+        self.paged_viewer = open_document.viewer
+
+        if open_document.viewer is not None:
+            self.text_edit.hide()
+            open_document.viewer.show()
+        else:
+            if open_document.document is None:
+                if open_document.snapshot_is_current():
+                    open_document.restore()
+                    self.prepare_document(open_document)
+                    self.start_journal(open_document)
+                else:
+                    # Changed on disk since it was evicted, so read it again
+                    open_document.snapshot = None
+                    open_document.lossy = False
+                    open_document.document = documents.new_document()
+                    self.prepare_document(open_document)
+                    self.queue_loading(open_document)
+
+            document = open_document.document
+            if self.text_edit.document() is not document:
+                self.text_edit.set_document(document)
+                cursor = QTextCursor(document)
+                cursor.setPosition(min(open_document.cursor_position, document.characterCount() - 1))
+                self.text_edit.setTextCursor(cursor)
+                self.text_edit.verticalScrollBar().setValue(open_document.scroll_position)
+            self.update_read_only()
+            self.text_edit.show()
+        self.long_line_banner.setVisible(open_document.viewer is None and self.text_edit.line_map is not None)
+
+        self.tab_bar.blockSignals(True)
+        self.tab_bar.setCurrentIndex(self.tab_index(open_document.path))
+        self.tab_bar.blockSignals(False)
+        self.trim_documents()
+        self.update_presence()
+        self.update_outline()
+
+    def show_empty_document(self, text=""):
+        # Nothing open, back to an untitled document
+        self.current_document = None
+        self.current_file = None
+        if self.paged_viewer is not None:
+            self.paged_viewer.hide()
+            self.paged_viewer = None
+
+        document = documents.new_document(text)
+        document.setModified(bool(text))  # Text given here is a recovered buffer, not something on disk
+        if self.untitled_journal is not None:
+            self.untitled_journal.discard()
+            self.untitled_journal.detach()
+        self.untitled_journal = journal.EditJournal(document)
+        self.text_edit.set_document(document)
+        self.text_edit.setReadOnly(False)
+        self.text_edit.show()
+        self.update_presence()
+        self.update_outline()
+
+    def update_presence(self):
+        # Show the file being edited and its language, the worker throttles and coalesces the updates
+        if self.presence is None:
+            return
+        if self.current_file is None:
+            self.presence.set_activity("Coding Away in Qwerty")
+            return
+        lexer = highlighter.lexer_for_path(self.current_file)
+        self.presence.set_activity(f"Editing {os.path.basename(self.current_file)}", lexer.name if lexer is not None else "Plain text")
+
+    def trim_documents(self):
+        # Drop least recently used documents to snapshots once the cache is over its budget
+        def can_evict(open_document):
+            return (open_document is not self.current_document and not self.is_loading(open_document)
+                    and not self.document_saver.uses(open_document.document))
+
+        self.documents.trim(can_evict)
+
+    def tab_index(self, file_path):
+        for index in range(self.tab_bar.count()):
+            if self.tab_bar.tabData(index) == file_path:
+                return index
+        return -1
+
+    def update_tab_title(self, file_path):
+        index = self.tab_index(file_path)
+        open_document = self.documents.get(file_path)
+        if index >= 0 and open_document is not None and open_document.document is not None:
+            modified = " *" if open_document.document.isModified() else ""
+            self.tab_bar.setTabText(index, os.path.basename(file_path) + modified)
+
+    def tab_changed(self, index):
+        if index >= 0:
+            open_document = self.documents.get(self.tab_bar.tabData(index))
+            if open_document is not None and open_document is not self.current_document:
+                self.show_document(open_document)
+
+    def close_tab(self, index):
+        open_document = self.documents.get(self.tab_bar.tabData(index))
+        if open_document is not None:
+            self.close_document(open_document)
+
+    def close_current_tab(self):
+        if self.current_document is not None:
+            self.close_document(self.current_document)
+
+    def close_document(self, open_document, ask=True):
+        # Returns whether the document was closed, the user can cancel when it has unsaved changes
+        if open_document is self.loading_document:
+            self.cancel_loading()  # Closes it once the reader has stopped
+            return True
+        if open_document in self.queued_loads:
+            self.queued_loads.remove(open_document)
+
+        document = open_document.document
+        if ask and document is not None and document.isModified():
+            answer = QMessageBox.question(self, "Unsaved Changes", f"Save changes to {os.path.basename(open_document.path)}?",
+                                          QMessageBox.Save | QMessageBox.Discard | QMessageBox.Cancel)
+            if answer == QMessageBox.Cancel:
+                return False
+            if answer == QMessageBox.Save:
+                self.document_saver.save(document, open_document.path, encoding=open_document.encoding)
+        if document is not None:
+            self.document_saver.release(document)
+
+        self.documents.remove(open_document.path)
+        if open_document is self.current_document:
+            remaining = list(self.documents.open_documents.values())
+            if remaining:
+                self.show_document(remaining[-1])  # The most recently used one
+            else:
+                self.show_empty_document()
+
+        self.tab_bar.blockSignals(True)
+        self.tab_bar.removeTab(self.tab_index(open_document.path))
+        self.tab_bar.blockSignals(False)
+        open_document.close()
+        return True
+
+    def insert_loaded_text(self, text):
+        reader = self.sender()
+        if reader is not self.file_reader:
+            return  # Chunk from a load that was cancelled
+
+        document = self.loading_document.document
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        if longlines.has_long_line(text, cursor.positionInBlock()):
+            # Minified or generated text, split so no block is too long to lay out
+            longlines.insert_chunked(cursor, text)
+            if self.text_edit.document() is document:
+                self.text_edit.update_long_line_mode()
+        else:
+            cursor.insertText(text)
+        reader.chunk_consumed()
+
+        # Jump as soon as the line is in, rather than after the whole file
+        if self.pending_line is not None and self.current_document is self.loading_document and self.pending_line < document.blockCount() - 1:
+            self.go_to_line(self.pending_line)
+
+    def go_to_line(self, line):
+        self.pending_line = None
+        if self.paged_viewer is not None:
+            self.paged_viewer.go_to_line(line)
+            return
+
+        if self.current_document is not None and self.is_loading(self.current_document) and line >= self.text_edit.blockCount() - 1:
+            self.pending_line = line  # Not streamed in yet
+            return
+
+        block = longlines.find_line(self.text_edit.document(), line)
+        self.text_edit.setTextCursor(QTextCursor(block))
+        self.text_edit.centerCursor()
+        self.text_edit.setFocus()
+
+    def show_load_progress(self, done, total):
+        if self.sender() is self.file_reader:
+            self.load_progress.setRange(0, max(1, total))
+            self.load_progress.setValue(done)
+
+    def finish_loading(self):
+        if self.sender() is not self.file_reader:
+            return
+
+        open_document = self.loading_document
+        document = open_document.document
+        encoding = open_document.encoding
+        line = self.pending_line if self.current_document is open_document else None
+        self.end_loading()
+        document.setUndoRedoEnabled(True)
+        document.setModified(False)
+        perf.end("file_load")
+        self.start_journal(open_document)
+        if line is not None:
+            self.go_to_line(line)
+        self.trim_documents()
+        self.load_next()
+        if open_document.lossy:
+            QMessageBox.warning(self, "Error", f"Some bytes aren't valid {encoding} and were replaced, so the file is open read-only.")
+
+    def reload_undecodable(self):
+        # Past the sniffed start the file isn't valid in its encoding, so load it again in the next one to try, or
+        # with the bytes replaced and read-only when there is none. Saving must never write replacements over the file
+        if self.sender() is not self.file_reader:
+            return
+
+        self.file_reader.wait()
+        open_document = self.loading_document
+        fallback = fileloader.fallback_encoding(open_document.encoding)
+        if fallback is not None:
+            open_document.encoding = fallback
+        else:
+            open_document.lossy = True
+
+        old_document = open_document.document
+        open_document.document = documents.new_document()
+        self.prepare_document(open_document)
+        if self.text_edit.document() is old_document:
+            self.text_edit.set_document(open_document.document)
+        old_document.deleteLater()
+        self.start_loading(open_document)
+
+    def fail_loading(self, message):
+        if self.sender() is not self.file_reader:
+            return
+
+        open_document = self.loading_document
+        self.end_loading()
+        self.close_document(open_document, ask=False)
+        self.load_next()
+        QMessageBox.warning(self, "Error", f"Failed to open the file: {message}")
+
+    def cancel_loading(self):
+        if self.file_reader is None or not self.file_reader.isRunning():
+            return
+
+        self.file_reader.cancel()
+        self.file_reader.wait()  # The reader stops at its next chunk
+        open_document = self.loading_document
+        self.end_loading()
+
+        # Only part of the file was read, so close it rather than leave something Ctrl+S could write over the original
+        self.close_document(open_document, ask=False)
+        self.load_next()
+
+    def end_loading(self):
+        if self.current_document is self.loading_document:
+            self.pending_line = None
+        self.file_reader = None
+        self.loading_document = None
+        self.load_progress.hide()
+        self.load_cancel_button.hide()
+        self.update_read_only()
+
+    def update_read_only(self):
+        # A file still loading is only partly in the editor, and saving one with replaced bytes would lose them
+        current = self.current_document
+        self.text_edit.setReadOnly(current is not None and (self.is_loading(current) or current.lossy))
+
+    def load_next(self):
+        # Start streaming in the file that has waited longest
+        if self.queued_loads and self.loading_document is None:
+            self.start_loading(self.queued_loads.pop(0))
 
     def save_file(self):
-        # Save the current file with the content from QTextEdit
-        if hasattr(self, 'current_file') and self.current_file:
-            with open(self.current_file, "w") as file:
-                file.write(self.text_edit.toPlainText())
+        # Huge files are shown read-only, a file still loading is only partly in the editor and one with replaced bytes would lose them
+        if self.paged_viewer is not None or (self.current_document is not None and (self.is_loading(self.current_document) or self.current_document.lossy)):
+            return
+
+        # Save the current file with the content from the editor
+        if self.current_document is not None:
+            self.document_saver.save(self.current_document.document, self.current_document.path, encoding=self.current_document.encoding)
         else:
             # If no file is selected, show a file dialog to save
             file_path, _ = QFileDialog.getSaveFileName(self, "Save File", "", "Text Files (*.txt);;All Files (*)")
             if file_path:
-                with open(file_path, "w") as file:
-                    file.write(self.text_edit.toPlainText())
-                self.current_file = file_path  # Store the file path for future saves
+                document = self.text_edit.document()
+                self.document_saver.save(document, file_path, force=True)
+                self.adopt_document(document, os.path.abspath(file_path))
+
+    def adopt_document(self, document, file_path):
+        # The untitled document becomes the document of the file it was saved as
+        existing = self.documents.get(file_path)
+        if existing is not None:
+            self.close_document(existing, ask=False)
+
+        if self.untitled_journal is not None and self.untitled_journal.document is document:
+            self.untitled_journal.discard()
+            self.untitled_journal.detach()
+            self.untitled_journal = None
+
+        open_document = documents.OpenDocument(file_path)
+        open_document.document = document
+        self.prepare_document(open_document)
+        self.start_journal(open_document)
+        self.add_tab(open_document)
+        self.show_document(open_document)
+        self.update_tab_title(file_path)
+
+    def start_journal(self, open_document):
+        # Log the edits of a document that is ready to be edited
+        open_document.journal = journal.EditJournal(open_document.document, open_document.path, open_document.encoding)
+
+    def recover_journals(self):
+        # Offer back the unsaved edits of a session that ended without saving them
+        for recovered in journal.find_recoverable():
+            name = os.path.basename(recovered.path) if recovered.path else "an untitled file"
+            answer = QMessageBox.question(self, "Recover Unsaved Changes", f"Qwerty closed with unsaved changes to {name}. Recover them?",
+                                          QMessageBox.Yes | QMessageBox.No)
+            if answer == QMessageBox.Yes:
+                try:
+                    text = recovered.replay()
+                except (OSError, ValueError, LookupError) as e:
+                    QMessageBox.warning(self, "Error", f"Failed to recover {name}: {e}")
+                else:
+                    self.open_recovered(recovered.path, text, recovered.encoding)
+            recovered.discard()
+
+        # Taken after recovering, so journals left by an earlier process with our pid count as abandoned
+        self.session_lock = journal.lock_session()
+
+    def open_recovered(self, file_path, text, encoding="utf-8"):
+        # Show a recovered buffer as unsaved changes, in its file's tab or as the untitled document
+        if file_path is None:
+            self.show_empty_document(text)
+            return
+
+        existing = self.documents.get(file_path)
+        if existing is not None:
+            self.close_document(existing, ask=False)
+
+        open_document = documents.OpenDocument(file_path)
+        open_document.encoding = encoding
+        open_document.document = documents.new_document(text)
+        open_document.document.setModified(True)
+        self.prepare_document(open_document)
+        self.start_journal(open_document)
+        self.add_tab(open_document)
+        self.show_document(open_document)
+        self.update_tab_title(file_path)
+
+    def file_saved(self, file_path):
+        open_document = self.documents.get(file_path)
+        if open_document is not None and open_document.journal is not None:
+            open_document.journal.file_saved()
+
+    def save_failed(self, file_path, message):
+        QMessageBox.warning(self, "Error", f"Failed to save {os.path.basename(file_path)}: {message}")
 
     def show_context_menu(self, position):
         # Create context menu
@@ -170,7 +928,19 @@ class TextEditorApp(QWidget):
         # Get the clicked index in the tree view
         index = self.tree_view.indexAt(position)
         if index.isValid():
-            # If a file or folder is clicked, add delete option
+            # If a file or folder is clicked, add rename, move, copy and delete options
+            rename_action = QAction("Rename...", self)
+            rename_action.triggered.connect(lambda: self.rename_file(index))
+            context_menu.addAction(rename_action)
+
+            move_action = QAction("Move To...", self)
+            move_action.triggered.connect(lambda: self.transfer_file(index, "move"))
+            context_menu.addAction(move_action)
+
+            copy_action = QAction("Copy To...", self)
+            copy_action.triggered.connect(lambda: self.transfer_file(index, "copy"))
+            context_menu.addAction(copy_action)
+
             delete_action = QAction("Delete", self)
             delete_action.triggered.connect(lambda: self.delete_file(index))
             context_menu.addAction(delete_action)
@@ -198,16 +968,31 @@ class TextEditorApp(QWidget):
 
     def delete_file(self, index):
         # Get the file path from the selected index
-        file_path = self.folder_model.filePath(index)
+        file_path = self.file_path(index)
 
-        try:
-            # Use shutil.rmtree to delete non-empty directories
-            if os.path.isdir(file_path):
-                shutil.rmtree(file_path)  # This deletes the folder and all its contents
-            else:
-                os.remove(file_path)  # Remove file
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"Failed to delete the file: {e}")
+        # Renamed out of sight at once (unless fastDelete is off), the contents are removed in the background
+        use_trash = self.settings.value("fastDelete", True, type=bool)
+        self.file_operations.submit(fileops.FileOperation("delete", file_path), use_trash)
+
+    def rename_file(self, index):
+        file_path = self.file_path(index)
+        name, ok = QInputDialog.getText(self, "Rename", "Enter the new name:", text=os.path.basename(file_path))
+        if ok and name and name != os.path.basename(file_path):
+            destination = os.path.join(os.path.dirname(file_path), name)
+            self.file_operations.submit(fileops.FileOperation("rename", file_path, destination))
+
+    def transfer_file(self, index, kind):
+        # Move or copy a file or folder into another folder
+        file_path = self.file_path(index)
+        title = "Move To" if kind == "move" else "Copy To"
+        folder = QFileDialog.getExistingDirectory(self, title, self.folder_model.rootPath())
+        if folder:
+            destination = os.path.join(folder, os.path.basename(file_path))
+            self.file_operations.submit(fileops.FileOperation(kind, file_path, destination))
+
+    def file_operation_finished(self, operation, message):
+        if message and message != "Cancelled":
+            QMessageBox.warning(self, "Error", f"{operation.description()} failed: {message}")
 
     def create_file(self):
         # Get the directory path for creating a file
@@ -225,15 +1010,11 @@ class TextEditorApp(QWidget):
         if ok and file_name:
             file_path = os.path.join(folder_path, file_name)
 
-            # Create the file
-            try:
-                if not os.path.exists(file_path):
-                    with open(file_path, 'w') as file:
-                        file.write("")  # Create an empty file
-                else:
-                    QMessageBox.warning(self, "Error", "File already exists!")
-            except OSError:
-                QMessageBox.warning(self, "Error", "Cant have special characters in filename!")
+            # Create the file, queued behind any operation still running in the folder
+            if not os.path.exists(file_path):
+                self.file_operations.submit(fileops.FileOperation("create_file", file_path))
+            else:
+                QMessageBox.warning(self, "Error", "File already exists!")
 
     def create_folder(self):
         # Get the directory path for creating a folder
@@ -253,7 +1034,7 @@ class TextEditorApp(QWidget):
 
             # Create the folder
             if not os.path.exists(new_folder_path):
-                os.mkdir(new_folder_path)
+                self.file_operations.submit(fileops.FileOperation("create_folder", new_folder_path))
             else:
                 QMessageBox.warning(self, "Error", "Folder already exists!")
 
@@ -261,9 +1042,9 @@ class TextEditorApp(QWidget):
         # If no folder is selected, use the root path from the tree view
         if not selected_indexes:
             current_index = self.tree_view.rootIndex()
-            return self.folder_model.filePath(current_index)
+            return self.file_path(current_index)
 
-        file_path = self.folder_model.filePath(selected_indexes[0])
+        file_path = self.file_path(selected_indexes[0])
 
         if os.path.isfile(file_path):  # If it's a file, get the parent directory
             return os.path.dirname(file_path)
@@ -274,11 +1055,26 @@ class TextEditorApp(QWidget):
             return None
 
 
+# Files are streamed in rather than set with setPlainText, so each chunk inserted is what a load costs the GUI
+perf.instrument(TextEditorApp, "insert_loaded_text", "load_chunk")
+
+
 # Run the application
 if __name__ == "__main__":
+    if getattr(sys, "frozen", False):
+        import multiprocessing
+        multiprocessing.freeze_support()  # Search workers are started by re-running a frozen executable
+
+    if "--profile-startup" in sys.argv:
+        sys.argv.remove("--profile-startup")
+        perf.startup_profile = perf.StartupProfile(STARTED)
+    perf.mark_startup("imports")
+
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon("logo.ico"))
+    perf.mark_startup("application")
 
     editor = TextEditorApp()
     editor.show()
+    perf.mark_startup("show")
     sys.exit(app.exec_())
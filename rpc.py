@@ -1,28 +1,134 @@
-from pypresence import Presence
-from dotenv import load_dotenv
-import time, os
+import threading
+import queue
+import time
+import os
 
 rpc_enable = False
 
-if rpc_enable:
+
+def client_id_from_environment():
+    from dotenv import load_dotenv
+
     load_dotenv()
+    return os.getenv("DISCORD_CLIENT_ID")
+
+
+def discord_presence(client_id):
+    """ Creates a pypresence client, imported here so the asyncio stack under it only loads when presence is used """
+    from pypresence import Presence
+
+    # Short timeouts, a Discord that doesn't answer shouldn't hold back the updates queued behind it
+    return Presence(client_id, connection_timeout=5, response_timeout=5)
+
+
+class PresenceWorker:
+    """ Owns the Discord connection on a background thread and shows what is being edited.
+
+    set_activity only queues the latest activity, which is sent at most once every MIN_UPDATE_SECONDS,
+    so switching files quickly costs one update. When Discord isn't running or the connection drops,
+    the worker retries with exponential backoff while the GUI carries on unaware.
+
+    presence_factory(client_id) creates the client, anything with connect, update, clear and close
+    will do, such as a client pointed at a fake IPC socket.
+    """
+
+    MIN_UPDATE_SECONDS = 15  # Discord's own limit on activity updates
+    FIRST_RETRY_SECONDS = 5
+    MAX_RETRY_SECONDS = 300
+
+    def __init__(self, client_id=None, presence_factory=discord_presence):
+        self.client_id = client_id  # Read from the environment (and .env) on the worker when None
+        self.presence_factory = presence_factory
+        self.requests = queue.Queue()  # Activities to show, None to stop
+        self.started = time.time()  # Session start, kept across updates so Discord's elapsed time doesn't reset
+        self.error = None  # Last connection or update failure, for diagnostics
+
+        # A daemon thread, so a Discord that never answers can't keep the editor from exiting
+        self.thread = threading.Thread(target=self.run, name="discord-presence", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def set_activity(self, details, state=None):
+        self.requests.put({"details": details, "state": state})
+
+    def stop(self, timeout=0.5):
+        """ Asks the worker to clear the presence and disconnect, waiting at most timeout seconds """
+        self.requests.put(None)
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def run(self):
+        presence = None
+        pending = None  # Activity not sent yet
+        next_connect = 0.0
+        retry_seconds = self.FIRST_RETRY_SECONDS
+        next_update = 0.0
+
+        try:
+            if self.client_id is None:
+                self.client_id = client_id_from_environment()
+                if not self.client_id:
+                    self.error = "Discord Client ID is missing. Please set it in the .env file."
+                    return
+
+            while True:
+                # Sleep until there is something to send and it may be sent
+                timeout = None
+                if pending is not None:
+                    timeout = max(0.0, (next_update if presence is not None else next_connect) - time.monotonic())
+                try:
+                    request = self.requests.get(timeout=timeout)
+                    if request is None:
+                        break
+                    pending = request
+                    while True:  # Only the newest activity matters
+                        request = self.requests.get_nowait()
+                        if request is None:
+                            return
+                        pending = request
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                if pending is None:
+                    continue
+
+                if presence is None:
+                    if now < next_connect:
+                        continue
+                    try:
+                        presence = self.presence_factory(self.client_id)
+                        presence.connect()
+                        retry_seconds = self.FIRST_RETRY_SECONDS
+                    except Exception as e:  # Not running, no socket, rejected: all just mean try again later
+                        self.error = str(e) or type(e).__name__
+                        presence = None
+                        next_connect = now + retry_seconds
+                        retry_seconds = min(retry_seconds * 2, self.MAX_RETRY_SECONDS)
+                        continue
+
+                if now < next_update:
+                    continue
+                try:
+                    presence.update(start=self.started, large_image="logo", large_text="Qwerty", **pending)
+                    pending = None
+                    next_update = now + self.MIN_UPDATE_SECONDS
+                except Exception as e:
+                    # The connection is gone, reconnect and resend the activity
+                    self.error = str(e) or type(e).__name__
+                    self.close_quietly(presence, clear=False)
+                    presence = None
+                    next_connect = now + retry_seconds
+        finally:
+            if presence is not None:
+                self.close_quietly(presence)
 
-    CLIENT_ID = os.getenv("DISCORD_CLIENT_ID")
-
-    if not CLIENT_ID:
-        raise ValueError("Discord Client ID is missing. Please set it in the .env file.")
-    rpc = Presence(CLIENT_ID)
-    rpc.connect()
-
-def update():
-    rpc.update(
-        state=f"Coding Away in Qwerty",
-        details=f"F off",
-        start=time.time(),  # Start time for session
-        large_image="logo",  # Must be uploaded in Discord Developer Portal
-        large_text="Qwerty"
-    )
-
-def close():
-    rpc.clear()
-    rpc.close()
+    @staticmethod
+    def close_quietly(presence, clear=True):
+        try:
+            if clear:
+                presence.clear()
+            presence.close()
+        except Exception:
+            pass  # Already disconnected
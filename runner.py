@@ -0,0 +1,220 @@
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit, QPushButton, QLabel, QInputDialog
+from PyQt5.QtCore import QProcess, QProcessEnvironment, QTimer
+from PyQt5.QtGui import QTextCursor
+import codecs
+import shlex
+import time
+import os
+import sys
+
+
+def default_interpreter():
+    """ The Python running the editor, or the one on PATH when the editor is a frozen executable """
+    if getattr(sys, "frozen", False):
+        return "py" if os.name == "nt" else "python3"
+    return sys.executable
+
+
+def split_command(command):
+    """ Splits an interpreter command into the program and its arguments, quotes keep spaces in a word.
+
+    Backslashes are left alone so Windows paths come through, and a command that is the path of a file
+    is that program even with spaces in it. Raises ValueError on an unclosed quote.
+    """
+    if os.path.isfile(command):
+        return [command]
+    lexer = shlex.shlex(command, posix=True)
+    lexer.whitespace_split = True
+    lexer.escape = ""
+    return list(lexer)
+
+
+class OutputPanel(QWidget):
+    """ Runs a script as a child process and streams its output.
+
+    Output is appended in batches on a timer rather than per read, so a script printing in a tight
+    loop costs the GUI a few appends a second. The view keeps at most MAX_LINES lines and text
+    waiting to be shown is capped at MAX_PENDING_CHARS, dropping the oldest when a script floods it.
+    """
+
+    MAX_LINES = 10000
+    MAX_PENDING_CHARS = 1024 * 1024
+    FLUSH_INTERVAL_MS = 50
+    REBUILD_LINES = 2000  # Lines per flush past which the view is rebuilt instead of appended to
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.command = None  # (script, interpreter) of the last run, for rerunning
+        self.decoder = None
+        self.pending = []
+        self.pending_chars = 0
+        self.dropped_chars = 0
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)  # Keeps stdout and stderr in order
+        self.process.readyReadStandardOutput.connect(self.read_output)
+        self.process.finished.connect(self.process_finished)
+        self.process.errorOccurred.connect(self.process_error)
+
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(self.MAX_LINES)  # Oldest lines are dropped past this
+        self.output.setLineWrapMode(QPlainTextEdit.NoWrap)
+
+        self.status_label = QLabel()
+        self.rerun_button = QPushButton("Rerun")
+        self.rerun_button.clicked.connect(self.rerun)
+        self.kill_button = QPushButton("Kill")
+        self.kill_button.clicked.connect(self.kill)
+        self.clear_button = QPushButton("Clear")
+        self.clear_button.clicked.connect(self.output.clear)
+        self.interpreter_button = QPushButton("Interpreter...")
+        self.interpreter_button.clicked.connect(self.choose_interpreter)
+        self.update_buttons()
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(self.FLUSH_INTERVAL_MS)
+        self.flush_timer.timeout.connect(self.flush_output)
+
+        bar = QHBoxLayout()
+        bar.addWidget(self.status_label, 1)
+        bar.addWidget(self.rerun_button)
+        bar.addWidget(self.kill_button)
+        bar.addWidget(self.clear_button)
+        bar.addWidget(self.interpreter_button)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(bar)
+        layout.addWidget(self.output)
+
+    def interpreter(self):
+        return self.settings.value("pythonInterpreter", default_interpreter())
+
+    def choose_interpreter(self):
+        interpreter, ok = QInputDialog.getText(self, "Interpreter", "Command used to run scripts:", text=self.interpreter())
+        if ok and interpreter.strip():
+            self.settings.setValue("pythonInterpreter", interpreter.strip())
+
+    def is_running(self):
+        return self.process.state() != QProcess.NotRunning
+
+    def run(self, script, interpreter=None):
+        """ Starts script with interpreter (the configured one by default), killing a run still in progress """
+        self.kill()
+        interpreter = interpreter or self.interpreter()
+        self.command = (script, interpreter)
+        self.output.clear()
+        self.pending = []
+        self.pending_chars = 0
+        self.dropped_chars = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        # Unbuffered, so prints show up as they happen rather than when the pipe fills
+        environment = QProcessEnvironment.systemEnvironment()
+        environment.insert("PYTHONUNBUFFERED", "1")
+        environment.insert("PYTHONIOENCODING", "utf-8")
+        self.process.setProcessEnvironment(environment)
+        self.process.setWorkingDirectory(os.path.dirname(script))
+
+        try:
+            program, *arguments = split_command(interpreter)
+        except ValueError as e:
+            self.queue_output(f"[Can't run {interpreter}: {e}]\n")
+            self.flush_output()
+            self.status_label.setText("Failed to start")
+            return
+
+        self.status_label.setText(f"Running {os.path.basename(script)}")
+        self.process.start(program, arguments + [script])
+        self.update_buttons()
+
+    def rerun(self):
+        if self.command is not None:
+            self.run(*self.command)
+
+    def kill(self):
+        if self.is_running():
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+    def read_output(self):
+        text = self.decoder.decode(bytes(self.process.readAllStandardOutput()))
+        if text:
+            self.queue_output(text)
+
+    def queue_output(self, text):
+        self.pending.append(text)
+        self.pending_chars += len(text)
+
+        # Only the tail of a flood is ever shown, so don't hold on to the rest
+        while self.pending_chars > self.MAX_PENDING_CHARS and len(self.pending) > 1:
+            dropped = self.pending.pop(0)
+            self.pending_chars -= len(dropped)
+            self.dropped_chars += len(dropped)
+
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush_output(self):
+        if not self.pending:
+            return
+
+        started = time.perf_counter()
+        text = "".join(self.pending).replace("\r\n", "\n")
+        self.pending = []
+        self.pending_chars = 0
+
+        # Follow the output only when the view is already at the bottom
+        scroll_bar = self.output.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum()
+
+        if text.count("\n") < self.REBUILD_LINES and not self.dropped_chars:
+            cursor = QTextCursor(self.output.document())
+            cursor.movePosition(QTextCursor.End)
+            cursor.insertText(text)
+        else:
+            # Appending costs per line, past a point it's cheaper to set the last MAX_LINES lines in one go
+            shown = self.output.toPlainText()
+            if self.dropped_chars:
+                shown += f"\n[... {self.dropped_chars} characters of output dropped ...]\n"
+                self.dropped_chars = 0
+            text = shown + text
+            cut = len(text)
+            for _ in range(self.MAX_LINES - 1):
+                cut = text.rfind("\n", 0, cut)
+                if cut < 0:
+                    break
+            self.output.setPlainText(text[cut + 1:])
+
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+        # A script flooding the pane gets fewer, bigger flushes, keeping the GUI mostly idle
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flush_timer.setInterval(max(self.FLUSH_INTERVAL_MS, int(elapsed_ms * 4)))
+
+    def process_finished(self, exit_code, exit_status):
+        self.read_output()
+        self.queue_output(self.decoder.decode(b"", final=True))
+        if exit_status == QProcess.CrashExit:
+            self.queue_output("\n[Process was killed]\n")
+        else:
+            self.queue_output(f"\n[Process exited with code {exit_code}]\n")
+        self.flush_output()
+        self.status_label.setText(f"Finished {os.path.basename(self.command[0])}")
+        self.update_buttons()
+
+    def process_error(self, error):
+        if error == QProcess.FailedToStart:
+            self.queue_output(f"[Failed to start {self.command[1]}: {self.process.errorString()}]\n")
+            self.flush_output()
+            self.status_label.setText("Failed to start")
+            self.update_buttons()
+
+    def update_buttons(self):
+        running = self.is_running()
+        self.kill_button.setEnabled(running)
+        self.rerun_button.setEnabled(self.command is not None)
@@ -0,0 +1,317 @@
+from PyQt5.QtWidgets import QTreeWidget, QTreeWidgetItem
+from PyQt5.QtCore import Qt, QObject, QThread, QStandardPaths, pyqtSignal
+import hashlib
+import heapq
+import queue
+import json
+import ast
+import os
+
+import projectsearch
+
+CACHE_VERSION = 1
+PYTHON_EXTENSIONS = (".py", ".pyi", ".pyw")
+
+# A symbol is (name, kind, line counted from 0, column, container), container being the dotted
+# path of the classes and functions it is nested in ("" at module level). Kinds in lookup order
+KINDS = ("class", "function", "method", "variable")
+
+
+def extract_symbols(tree):
+    symbols = []
+
+    def visit(body, container, in_class, in_function):
+        for node in body:
+            if isinstance(node, ast.ClassDef):
+                symbols.append((node.name, "class", node.lineno - 1, node.col_offset, container))
+                visit(node.body, f"{container}.{node.name}" if container else node.name, True, False)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                symbols.append((node.name, "method" if in_class else "function", node.lineno - 1, node.col_offset, container))
+                visit(node.body, f"{container}.{node.name}" if container else node.name, False, True)
+            elif in_function:
+                continue  # Locals aren't definitions anyone navigates to
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for name in ast.walk(target):  # Covers a, b = ... too
+                        if isinstance(name, ast.Name):
+                            symbols.append((name.id, "variable", name.lineno - 1, name.col_offset, container))
+            elif isinstance(node, (ast.If, ast.Try, ast.With, ast.AsyncWith)):
+                # Module-level conditionals (TYPE_CHECKING, try: import ...) still define names
+                for block in (node.body, getattr(node, "orelse", []), getattr(node, "finalbody", [])):
+                    visit(block, container, in_class, in_function)
+                for handler in getattr(node, "handlers", []):
+                    visit(handler.body, container, in_class, in_function)
+
+    visit(tree.body, "", False, False)
+    return symbols
+
+
+def parse_source(source):
+    """ Returns the symbols defined in Python source (str or bytes), None if it doesn't parse """
+    try:
+        return extract_symbols(ast.parse(source))
+    except (SyntaxError, ValueError, RecursionError):
+        return None
+
+
+def index_batch(items):
+    """ Indexes [(path, digest already indexed)] in a worker process.
+
+    Returns [(path, mtime_ns, size, digest, symbols)], symbols being None when the digest shows the
+    content didn't change (only the mtime moved). Unreadable files are left out.
+    """
+    results = []
+    for path, known_digest in items:
+        try:
+            with open(path, "rb") as file:
+                stat = os.fstat(file.fileno())
+                data = file.read()
+        except OSError:
+            continue
+        digest = hashlib.sha1(data).hexdigest()
+        symbols = None if digest == known_digest else (parse_source(data) or [])
+        results.append((path, stat.st_mtime_ns, stat.st_size, digest, symbols))
+    return results
+
+
+def cache_path(root):
+    """ Where the symbols of a workspace are cached between runs """
+    folder = os.path.join(QStandardPaths.writableLocation(QStandardPaths.GenericCacheLocation), "qwerty", "symbols")
+    return os.path.join(folder, hashlib.sha1(root.encode("utf-8")).hexdigest()[:16] + ".json")
+
+
+class SymbolIndexer(QThread):
+    """ Keeps the symbols of the workspace's Python files current, parsing changed files on the process pool.
+
+    Each file's entry is keyed by mtime and size, a file whose mtime moved is re-read and only
+    re-parsed when its hash changed too. Results are handed over in batches as they come in.
+    """
+
+    indexed = pyqtSignal(object, object)  # {path: symbols} changed, [paths] removed
+
+    BATCH_FILES = 64
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.requests = queue.Queue()  # ("sync", relative paths) or ("refresh", absolute paths), None to stop
+        self.entries = {}  # Absolute path -> [mtime_ns, size, digest, symbols]
+
+    def sync(self, relative_paths):
+        """ Brings the index in line with the workspace's current file list """
+        self.requests.put(("sync", relative_paths))
+
+    def refresh(self, paths):
+        """ Re-indexes files known to have changed, such as one just saved """
+        self.requests.put(("refresh", paths))
+
+    def stop(self):
+        self.requests.put(None)
+
+    def run(self):
+        self.load_cache()
+        cached = list(self.entries.items())
+        for i in range(0, len(cached), self.BATCH_FILES * 16):  # In pieces, so the GUI takes them in between events
+            self.indexed.emit({path: entry[3] for path, entry in cached[i:i + self.BATCH_FILES * 16]}, [])
+
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+
+            # Only the latest file list matters, refreshes are merged
+            sync = request[1] if request[0] == "sync" else None
+            refresh = set() if request[0] == "sync" else set(request[1])
+            while True:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    return
+                if request[0] == "sync":
+                    sync = request[1]
+                else:
+                    refresh.update(request[1])
+
+            removed = []
+            if sync is not None:
+                present = {os.path.join(self.root, *path.split("/")) for path in sync if path.endswith(PYTHON_EXTENSIONS)}
+                removed = [path for path in self.entries if path not in present]
+                for path in removed:
+                    del self.entries[path]
+                refresh.update(path for path in present if self.changed(path))
+            else:
+                refresh = {path for path in refresh if path.endswith(PYTHON_EXTENSIONS)}
+
+            if removed:
+                self.indexed.emit({}, removed)
+            if refresh:
+                self.index(sorted(refresh))
+                self.save_cache()
+            elif removed:
+                self.save_cache()
+
+    def changed(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return True
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False  # Gone, the next file list drops it
+        return (stat.st_mtime_ns, stat.st_size) != (entry[0], entry[1])
+
+    def index(self, paths):
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+
+        pool = projectsearch.shared_pool()
+        batches = (paths[i:i + self.BATCH_FILES] for i in range(0, len(paths), self.BATCH_FILES))
+        max_in_flight = os.cpu_count() or 1  # Leaves room in the pool's queue for an outline or a search
+
+        in_flight = set()
+        try:
+            while not self.isInterruptionRequested():
+                for batch in batches:
+                    items = [(path, self.entries[path][2] if path in self.entries else None) for path in batch]
+                    in_flight.add(pool.submit(index_batch, items))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                changed = {}
+                for future in done:
+                    for path, mtime, size, digest, symbols in future.result():
+                        if symbols is None:
+                            self.entries[path][:2] = [mtime, size]  # Touched, not changed
+                            continue
+                        self.entries[path] = [mtime, size, digest, symbols]
+                        changed[path] = symbols
+                if changed:
+                    self.indexed.emit(changed, [])
+        except BrokenProcessPool:
+            projectsearch.shutdown_pool()  # A worker died, the next sync starts a fresh pool
+
+    def load_cache(self):
+        try:
+            with open(cache_path(self.root), encoding="utf-8") as file:
+                cache = json.load(file)
+            if cache.get("version") == CACHE_VERSION and cache.get("root") == self.root:
+                self.entries = {os.path.join(self.root, *relative.split("/")): [mtime, size, digest, [tuple(symbol) for symbol in symbols]]
+                                for relative, (mtime, size, digest, symbols) in cache["entries"].items()}
+        except (OSError, ValueError, TypeError, KeyError):
+            self.entries = {}
+
+    def save_cache(self):
+        path = cache_path(self.root)
+        entries = {os.path.relpath(file_path, self.root).replace(os.sep, "/"): entry for file_path, entry in self.entries.items()}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"version": CACHE_VERSION, "root": self.root, "entries": entries}, file, separators=(",", ":"))
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # The cache only speeds up the next start
+
+
+class SymbolIndex(QObject):
+    """ Definitions of every Python symbol in the workspace, looked up by name in constant time """
+
+    updated = pyqtSignal()
+    outline_parsed = pyqtSignal(object, object)  # Token given to parse_outline, symbols
+
+    def __init__(self, file_index, parent=None):
+        super().__init__(parent)
+        self.file_index = file_index
+        self.indexer = None
+        self.by_file = {}  # Absolute path -> symbols
+        self.by_name = {}  # Name -> {(path, line, kind, container)}, sets so a file's old entries come out in constant time
+
+        file_index.updated.connect(self.files_updated)
+
+    def set_root(self, root):
+        self.stop()
+        self.by_file = {}
+        self.by_name = {}
+        self.indexer = SymbolIndexer(os.path.normpath(root))
+        self.indexer.indexed.connect(self.apply)
+        self.indexer.start()
+
+    def stop(self):
+        if self.indexer is not None:
+            self.indexer.requestInterruption()
+            self.indexer.stop()
+            self.indexer.wait()
+            self.indexer.deleteLater()
+            self.indexer = None
+
+    def files_updated(self):
+        if self.indexer is not None and self.file_index.ready:
+            self.indexer.sync(self.file_index.paths)
+
+    def file_saved(self, path):
+        if self.indexer is not None:
+            self.indexer.refresh([os.path.abspath(path)])
+
+    def apply(self, changed, removed):
+        if self.sender() is not self.indexer:
+            return
+
+        for path in list(removed) + list(changed):
+            for name, kind, line, column, container in self.by_file.pop(path, ()):
+                definitions = self.by_name.get(name)
+                if definitions is not None:
+                    definitions.discard((path, line, kind, container))
+                    if not definitions:
+                        del self.by_name[name]
+
+        for path, symbols in changed.items():
+            self.by_file[path] = symbols
+            for name, kind, line, column, container in symbols:
+                self.by_name.setdefault(name, set()).add((path, line, kind, container))
+        self.updated.emit()
+
+    def definitions(self, name, limit=50):
+        """ Returns [(path, line, kind, container)] of the first limit definitions of name, classes and functions first """
+        return heapq.nsmallest(limit, self.by_name.get(name, ()), key=lambda definition: (KINDS.index(definition[2]), definition[0], definition[1]))
+
+    def parse_outline(self, token, text):
+        """ Parses text on the process pool, outline_parsed carries the symbols back (None if it didn't parse) """
+        def parsed(future):
+            # Runs on the pool's own thread, the signal queues it over to the GUI
+            failed = future.cancelled() or future.exception() is not None
+            self.outline_parsed.emit(token, None if failed else future.result())
+
+        projectsearch.shared_pool().submit(parse_source, text).add_done_callback(parsed)
+
+
+class OutlinePanel(QTreeWidget):
+    """ The classes, functions and variables of the current document, nested as in the source """
+
+    line_activated = pyqtSignal(int)  # Line number counted from 0
+
+    ICONS = {"class": "C", "function": "f", "method": "m", "variable": "v"}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setHeaderHidden(True)
+        self.setUniformRowHeights(True)
+        self.itemActivated.connect(lambda item: self.line_activated.emit(item.data(0, Qt.UserRole)))
+
+    def show_symbols(self, symbols):
+        self.setUpdatesEnabled(False)
+        self.clear()
+        containers = {"": self.invisibleRootItem()}
+        for name, kind, line, column, container in symbols:
+            parent = containers.get(container, self.invisibleRootItem())
+            item = QTreeWidgetItem(parent, [f"{self.ICONS[kind]}  {name}"])
+            item.setData(0, Qt.UserRole, line)
+            item.setToolTip(0, f"{kind} {name}, line {line + 1}")
+            if kind != "variable":
+                containers[f"{container}.{name}" if container else name] = item
+        self.expandAll()
+        self.setUpdatesEnabled(True)
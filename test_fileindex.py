@@ -0,0 +1,65 @@
+import random
+import heapq
+
+import pytest
+
+import fileindex
+
+WORDS = ["src", "lib", "test", "tests", "a", "ab", "main", "Main", "util", "utils", "index", "x"]
+EXTENSIONS = [".py", ".pyi", ".txt", ".md", ""]
+
+
+def random_paths(rng, count):
+    paths = set()
+    while len(paths) < count:
+        folders = [rng.choice(WORDS) for _ in range(rng.randint(0, 3))]
+        name = "".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))) + rng.choice(EXTENSIONS)
+        paths.add("/".join(folders + [name]))
+    return sorted(paths)
+
+
+def brute_force(paths, query, limit):
+    """ Every path the query's characters appear in, in order, ranked by score as WorkspaceIndex.search ranks them """
+    query = query.strip().lower().replace("\\", "/")
+    if not query:
+        return paths[:limit]
+
+    def matches(path):
+        position = 0
+        for character in query:
+            position = path.lower().find(character, position) + 1
+            if not position:
+                return False
+        return True
+
+    ordered = sorted(paths, key=len)  # Ties keep their alphabetical order, as in the lookup
+    return heapq.nlargest(limit, (path for path in ordered if matches(path)), key=lambda path: fileindex.WorkspaceIndex.score(path, query))
+
+
+def indexed(paths):
+    index = fileindex.WorkspaceIndex()
+    index.paths = paths
+    index.lookup = fileindex.build_lookup(paths)
+    return index
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_search_ranks_like_a_brute_force_scan(seed):
+    rng = random.Random(seed)
+    paths = random_paths(rng, rng.randint(1, 400))
+    index = indexed(paths)
+    limit = rng.choice([1, 5, 50])
+
+    # Typed a character at a time, so later queries resume the scans of earlier ones
+    target = rng.choice(paths).lower()
+    start = rng.randint(0, len(target) - 1)
+    typed = target[start:start + rng.randint(1, 8)]
+    if rng.random() < 0.3:
+        typed = "".join(rng.sample(typed, len(typed)))  # Scrambled, mostly fuzzy matches or none
+    for end in range(1, len(typed) + 1):
+        query = typed[:end]
+        assert index.search(query, limit) == brute_force(paths, query, limit), query
+
+    # Starting over with a query that isn't an extension of the last one
+    query = rng.choice(WORDS)[:2]
+    assert index.search(query, limit) == brute_force(paths, query, limit), query
@@ -0,0 +1,178 @@
+import threading
+import socket
+import struct
+import json
+import sys
+import os
+
+import pytest
+
+import rpc
+
+pytestmark = pytest.mark.skipif(sys.platform not in ("linux", "darwin"), reason="The fake Discord listens on a Unix socket")
+
+WAIT_SECONDS = 10
+
+
+class FakeDiscord:
+    """ Speaks enough of Discord's IPC protocol on a Unix socket for pypresence to connect, update, clear and close.
+
+    Every frame a client sends is recorded as (connection number, op, payload).
+    """
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, "discord-ipc-0")
+        self.server = None
+        self.connections = []
+        self.frames = []
+        self.changed = threading.Condition()
+
+    def start(self):
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen()
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def stop(self):
+        self.drop()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def drop(self):
+        """ Closes every client connection, as Discord quitting would """
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+    def accept(self):
+        while True:
+            try:
+                connection, _ = self.server.accept()
+            except OSError:
+                return  # Stopped
+            self.connections.append(connection)
+            threading.Thread(target=self.serve, args=(connection, len(self.connections)), daemon=True).start()
+
+    def serve(self, connection, number):
+        # pypresence probes the socket with a connection that sends nothing, which just ends here
+        try:
+            while True:
+                header = self.read_exactly(connection, 8)
+                if header is None:
+                    return
+                op, length = struct.unpack("<II", header)
+                payload = json.loads(self.read_exactly(connection, length))
+                with self.changed:
+                    self.frames.append((number, op, payload))
+                    self.changed.notify_all()
+
+                if op == 0:  # Handshake
+                    self.send(connection, 1, {"cmd": "DISPATCH", "evt": "READY", "data": {"v": 1}, "nonce": None})
+                elif op == 1:  # Command, SET_ACTIVITY here
+                    self.send(connection, 1, {"cmd": payload["cmd"], "evt": None, "data": {}, "nonce": payload.get("nonce")})
+                elif op == 2:  # Close
+                    return
+        except OSError:
+            return
+        finally:
+            connection.close()
+
+    @staticmethod
+    def read_exactly(connection, size):
+        data = b""
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    @staticmethod
+    def send(connection, op, payload):
+        data = json.dumps(payload).encode("utf-8")
+        connection.sendall(struct.pack("<II", op, len(data)) + data)
+
+    def activities(self):
+        """ (connection number, activity) of every SET_ACTIVITY received, None for a clear """
+        return [(number, payload["args"].get("activity")) for number, op, payload in self.frames
+                if op == 1 and payload.get("cmd") == "SET_ACTIVITY"]
+
+    def wait_for(self, predicate):
+        with self.changed:
+            assert self.changed.wait_for(predicate, WAIT_SECONDS), self.frames
+
+
+@pytest.fixture
+def discord(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    fake = FakeDiscord(str(tmp_path))
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def worker():
+    worker = rpc.PresenceWorker(client_id="1234")
+    worker.MIN_UPDATE_SECONDS = 0
+    worker.FIRST_RETRY_SECONDS = 0.05
+    yield worker
+    worker.stop(timeout=WAIT_SECONDS)
+
+
+def details(activity):
+    return activity["details"] if activity is not None else None
+
+
+def test_retries_until_discord_is_running(discord, worker):
+    worker.start()
+    worker.set_activity("Editing a.py", "Python")
+    while worker.error is None and worker.thread.is_alive():
+        worker.thread.join(0.01)
+    assert worker.error is not None  # No socket yet, so the first connect failed
+    assert worker.thread.is_alive()
+
+    discord.start()
+    discord.wait_for(lambda: discord.activities())
+    assert [details(activity) for _, activity in discord.activities()] == ["Editing a.py"]
+    assert discord.activities()[0][1]["state"] == "Python"
+
+
+def test_reconnects_and_resends_after_the_connection_drops(discord, worker):
+    discord.start()
+    worker.start()
+    worker.set_activity("Editing a.py")
+    discord.wait_for(lambda: len(discord.activities()) == 1)
+    first_connection = discord.activities()[0][0]
+
+    discord.drop()
+    worker.set_activity("Editing b.py")
+    discord.wait_for(lambda: any(details(activity) == "Editing b.py" for _, activity in discord.activities()))
+    number, activity = discord.activities()[-1]
+    assert details(activity) == "Editing b.py"
+    assert number != first_connection
+
+
+def test_stop_clears_the_activity_and_disconnects(discord, worker):
+    discord.start()
+    worker.start()
+    worker.set_activity("Editing a.py")
+    discord.wait_for(lambda: len(discord.activities()) == 1)
+
+    worker.stop(timeout=WAIT_SECONDS)
+    assert not worker.thread.is_alive()
+    assert [details(activity) for _, activity in discord.activities()] == ["Editing a.py", None]
+    assert discord.frames[-1][1] == 2  # Closed after the clear
+
+
+def test_stop_while_unable_to_connect(discord, worker):
+    worker.start()
+    worker.set_activity("Editing a.py")
+    worker.stop(timeout=WAIT_SECONDS)
+    assert not worker.thread.is_alive()
+    assert discord.frames == []
@@ -0,0 +1,155 @@
+from PyQt5.QtCore import QSortFilterProxyModel
+import re
+import os
+
+# Excluded from every workspace unless the user configures otherwise
+DEFAULT_EXCLUDES = [".git", ".hg", ".svn", "node_modules", "__pycache__", ".mypy_cache", ".pytest_cache", ".tox"]
+
+# Part of the name deletes are renamed to while they are removed in the background, always hidden
+TRASH_MARKER = ".qwerty-deleted-"
+
+
+def translate_pattern(pattern):
+    """ Turns a .gitignore glob into a regex source (without anchors) """
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")  # Zero or more directories
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                out.append(re.escape(char))
+            else:
+                content = pattern[i + 1:end]
+                if content.startswith("!"):
+                    content = "^" + content[1:]
+                out.append(f"[{content}]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return "".join(out)
+
+
+class IgnoreRule:
+    """ One line of a .gitignore file, relative to the directory it came from """
+
+    def __init__(self, pattern, base):
+        self.base = base  # Directory the rule is relative to, with a trailing separator
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+
+        self.directory_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+
+        # A slash anywhere but the end anchors the pattern to base, otherwise it matches names at any depth
+        self.anchored = "/" in pattern
+        self.regex = re.compile(translate_pattern(pattern.lstrip("/")) + r"\Z")
+
+    def matches(self, path, name, is_dir):
+        if self.directory_only and not is_dir:
+            return False
+        if self.anchored:
+            if not path.startswith(self.base):
+                return False
+            return self.regex.match(path[len(self.base):].replace(os.sep, "/")) is not None
+        return self.regex.match(name) is not None
+
+
+def parse_ignore_file(path, base):
+    """ Reads the rules of a .gitignore file, returning [] if there is none """
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as file:
+            lines = file.read().splitlines()
+    except OSError:
+        return []
+
+    rules = []
+    for line in lines:
+        line = line.rstrip()
+        if line and not line.startswith("#"):
+            rules.append(IgnoreRule(line, base))
+    return rules
+
+
+class IgnoreRules:
+    """ Decides which paths of a workspace are hidden: its .gitignore files plus user excludes.
+
+    Like git, the last matching .gitignore rule wins and deeper .gitignore files come last.
+    User excludes are plain name globs that always win.
+    """
+
+    def __init__(self, root, excludes=DEFAULT_EXCLUDES):
+        self.root = os.path.normpath(root)
+        self.root_prefix = os.path.join(self.root, "")  # With a trailing separator, also right for "/"
+        self.excludes = re.compile("|".join(translate_pattern(pattern) for pattern in excludes) + r"\Z") if excludes else None
+        self.directory_rules = {}  # Directory -> rules that apply to its entries
+
+    def rules_for(self, directory):
+        """ Returns the rules for entries of directory, loading its .gitignore on first use """
+        rules = self.directory_rules.get(directory)
+        if rules is None:
+            if directory == self.root or not directory.startswith(self.root_prefix):
+                inherited = []
+            else:
+                inherited = self.rules_for(os.path.dirname(directory))
+            own = parse_ignore_file(os.path.join(directory, ".gitignore"), directory + os.sep)
+            rules = self.directory_rules[directory] = inherited + own if own else inherited
+        return rules
+
+    def is_ignored(self, path, is_dir):
+        path = os.path.normpath(path)
+        name = os.path.basename(path)
+        if TRASH_MARKER in name or (self.excludes is not None and self.excludes.match(name)):
+            return True
+
+        ignored = False
+        for rule in self.rules_for(os.path.dirname(path)):
+            if rule.negate == ignored and rule.matches(path, name, is_dir):
+                ignored = not rule.negate
+        return ignored
+
+
+class WorkspaceFilterModel(QSortFilterProxyModel):
+    """ Hides ignored entries of a QFileSystemModel.
+
+    Ignored directories never show up, so the tree never expands them and the model never lists them.
+    """
+
+    def __init__(self, rules=None, parent=None):
+        super().__init__(parent)
+        self.rules = rules
+
+    def set_rules(self, rules):
+        self.rules = rules
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.rules is None:
+            return True
+
+        model = self.sourceModel()
+        index = model.index(source_row, 0, source_parent)
+        path = os.path.normpath(model.filePath(index))
+
+        # Only filter inside the workspace, the entries above it are just the way down to its root
+        if not path.startswith(self.rules.root_prefix):
+            return True
+        return not self.rules.is_ignored(path, model.isDir(index))